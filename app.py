@@ -2,17 +2,39 @@ import streamlit as st
 import subprocess
 import os
 import json
-import tempfile
-import glob
+import io
+import time
 from datetime import datetime
 import re
 from collections import defaultdict
 import sys
 import base64
-from streamlit_pdf_viewer import pdf_viewer
-# --- 1. SETUP & IMPORTS ---
+import html
+import shutil
+import threading
+from urllib.parse import quote
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 try:
+    from streamlit_pdf_viewer import pdf_viewer
+except ImportError:
+    pdf_viewer = None  # PDFs are embedded as a base64 <iframe> instead
+
+st.set_page_config(page_title="MANGAGEN PARSOLA", layout="wide")
+
+# --- 1. SETUP & IMPORTS ---
+@st.cache_resource(show_spinner=False)
+def _get_layout():
+    """Import the layout module once per process; it drags in most of the pipeline."""
     from lib.layout.layout import MangaLayout
+    return MangaLayout
+
+try:
+    _get_layout()
 except ModuleNotFoundError:
     st.error("Error: 'lib' module not found. Please run 'pip install -e .' in your terminal.")
     st.stop()
@@ -20,84 +42,363 @@ except ImportError as e:
     st.error(f"Error importing: {e}. Did you run 'pip install -r requirements.txt'?")
     st.stop()
 
-st.set_page_config(page_title="MANGAGEN PARSOLA", layout="wide")
 st.title("Manga Generation")
 
 # --- 2. SESSION STATE MANAGEMENT ---
-if 'current_view_path' not in st.session_state:
-    st.session_state['current_view_path'] = None
-if 'generation_log' not in st.session_state:
-    st.session_state['generation_log'] = ""
+st.session_state.setdefault('current_view_path', None)
+st.session_state.setdefault('generation_log', "")
 
 # Ensure output folder exists
 OUTPUT_ROOT = "output"
-if not os.path.exists(OUTPUT_ROOT):
-    os.makedirs(OUTPUT_ROOT)
+os.makedirs(OUTPUT_ROOT, exist_ok=True)
+
+# Live log refresh: at most every LOG_FLUSH_INTERVAL seconds (or LOG_FLUSH_LINES lines),
+# showing only the last LOG_TAIL_CHARS characters
+LOG_FLUSH_INTERVAL = 0.1
+LOG_FLUSH_LINES = 50
+LOG_TAIL_CHARS = 8000
+
+# "<variation>_<kind>_<rank>_..." e.g. 00_name_2_onlyname.png
+_ID_RE = re.compile(r"^(\d+)_[^_]+_(\d+)_")
+DEFAULT_SCORE = {"final": -999, "clip": 0, "sim": 0, "geom": 0}
+
+VIEWER_CSS = """
+<style>
+div[data-testid="stVerticalBlockBorderWrapper"] {
+    border-width: 20px;
+    border-radius: 10px;
+}
+</style>
+"""
+
+# Panel images are served by Streamlit's static file server (see .streamlit/config.toml),
+# so the browser caches them across reruns. The server only serves real files inside ./static
+# (next to this script), so each image is hardlinked (or copied) to static/runs/<path under output>.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_RUNS_DIR = os.path.join(STATIC_DIR, "runs")
+STATIC_RUNS_URL = "app/static/runs"
+
+@st.cache_resource(show_spinner=False)
+def _pipeline_env():
+    """Environment for the pipeline subprocess, built once per process (module scope reruns every time)."""
+    return {**os.environ, "PYTHONIOENCODING": "utf-8"}
+
+# --- RUN FOLDER HELPERS ---
+@st.cache_resource
+def _static_runs_available():
+    """
+    Create static/runs once per process; False means fall back to st.image.
+    A symlink (e.g. the old static/runs -> output link) or a directory resolving outside ./static
+    is rejected: the static file server answers 400 for every file whose real path leaves ./static.
+    """
+    if os.path.islink(STATIC_RUNS_DIR):
+        return False
+    try:
+        os.makedirs(STATIC_RUNS_DIR, exist_ok=True)
+    except OSError:
+        return False
+    static_root = os.path.realpath(STATIC_DIR)
+    runs_root = os.path.realpath(STATIC_RUNS_DIR)
+    return runs_root != static_root and os.path.commonpath([static_root, runs_root]) == static_root
+
+def _publish_static(img_path):
+    """
+    Hardlink (or copy, across filesystems) an output image under static/runs and return its URL.
+    Returns None when it cannot be published, so the caller falls back to st.image.
+    """
+    rel = os.path.relpath(img_path, OUTPUT_ROOT)
+    if rel.startswith(os.pardir):
+        return None
+    dest = os.path.join(STATIC_RUNS_DIR, rel)
+    try:
+        src_stat = os.stat(img_path)
+        try:
+            dst_stat = os.stat(dest)
+            # Same inode (hardlink), or a copy at least as new as the source (copy2 keeps mtime)
+            fresh = os.path.samestat(src_stat, dst_stat) or (
+                dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns >= src_stat.st_mtime_ns
+            )
+        except FileNotFoundError:
+            fresh = False
+        if not fresh:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            # Sessions run in threads of one process, so the temp name is unique per thread
+            tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.link(img_path, tmp)
+            except OSError:
+                shutil.copy2(img_path, tmp)
+            os.replace(tmp, dest)
+    except OSError:
+        return None
+    return f"{STATIC_RUNS_URL}/{quote(rel.replace(os.sep, '/'))}"
+
+@st.cache_data(ttl=10)
+def get_run_folders():
+    try:
+        with os.scandir(OUTPUT_ROOT) as it:
+            dirs = [e.name for e in it if e.is_dir()]
+    except OSError:
+        return []
+    return sorted(dirs, reverse=True)
+
+def _find_pdf(root, predicate, min_depth=0, max_depth=None):
+    """
+    Breadth-first scandir search for the first file whose name satisfies `predicate`.
+    Only files `min_depth`..`max_depth` folders below `root` match (None = no limit).
+    Returns on the first hit; panel `images` folders are never descended into.
+    """
+    pending = [root]
+    depth = 0
+    while pending and (max_depth is None or depth <= max_depth):
+        subdirs = []
+        for d in pending:
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        if e.is_file():
+                            if depth >= min_depth and predicate(e.name):
+                                return e.path
+                        elif e.name != "images" and e.is_dir(follow_symlinks=False):
+                            subdirs.append(e.path)
+            except OSError:
+                continue
+        pending = subdirs
+        depth += 1
+    return None
+
+def _scan_run(view_path):
+    """
+    Walk <run>/*/images/panel*/ once and classify the files of every panel.
+    Returns {panel_name: {"dir": ..., "onlyname": [(name, path)...], "anime": [(name, path)...], "scores": path or None}}.
+    """
+    panels = {}
+    with os.scandir(view_path) as top:
+        for sub in top:
+            if not sub.is_dir():
+                continue
+            try:
+                images_it = os.scandir(f"{sub.path}{os.sep}images")
+            except OSError:
+                continue
+            with images_it:
+                for pentry in images_it:
+                    # first match wins (a run is expected to hold a single date folder)
+                    if not pentry.name.startswith("panel") or pentry.name in panels or not pentry.is_dir():
+                        continue
+                    onlyname, anime, scores = [], [], None
+                    with os.scandir(pentry.path) as files:
+                        for f in files:
+                            if not f.is_file():
+                                continue
+                            if f.name.endswith("_onlyname.png"):
+                                onlyname.append((f.name, f.path))
+                            elif f.name.endswith("_anime.png"):
+                                anime.append((f.name, f.path))
+                            elif f.name == "scores.json":
+                                scores = f.path
+                    panels[pentry.name] = {"dir": pentry.path, "onlyname": onlyname, "anime": anime, "scores": scores}
+    return panels
+
+def _run_signature(view_path):
+    """
+    Cache key for load_panel_index: mtimes of the run folder, of every <run>/*/images folder and of
+    every panel folder, plus each panel's scores.json mtime (0 when missing). Adding or renaming an
+    image only touches its panel folder, and rewriting scores.json in place only touches the file,
+    so the run folder's own mtime is not enough.
+    """
+    signature = [(view_path, os.stat(view_path).st_mtime_ns, 0)]
+    with os.scandir(view_path) as top:
+        for sub in top:
+            if not sub.is_dir():
+                continue
+            images_dir = f"{sub.path}{os.sep}images"
+            try:
+                images_it = os.scandir(images_dir)
+                signature.append((images_dir, os.stat(images_dir).st_mtime_ns, 0))
+            except OSError:
+                continue
+            with images_it:
+                for pentry in images_it:
+                    if not pentry.name.startswith("panel") or not pentry.is_dir():
+                        continue
+                    try:
+                        scores_mtime = os.stat(f"{pentry.path}{os.sep}scores.json").st_mtime_ns
+                    except OSError:
+                        scores_mtime = 0
+                    signature.append((pentry.path, pentry.stat().st_mtime_ns, scores_mtime))
+    return tuple(sorted(signature))
+
+def _load_scores(panel_name, score_file, scores_index):
+    """Flatten one scores.json into scores_index[(panel_name, variation_id, rank)]; parse errors are ignored."""
+    try:
+        with open(score_file, "rb") as f:
+            data = _json_loads(f.read())
+        for var in data.get("variations", []):
+            v_id = var.get("variation_id")
+            clip = var.get("clip_score", 0.0)
+            for layout in var.get("layout_options", []):
+                rank = layout.get("rank")
+                scores_index[(panel_name, v_id, rank)] = {
+                    "final": layout.get("final_score", -999),
+                    "clip": clip,
+                    "sim": layout.get("sim_score", 0),
+                    "geom": layout.get("geom_penalty", 999)
+                }
+    except Exception:
+        # ignore score parsing errors
+        pass
+
+# (threshold, text color, background color), checked from the top
+SCORE_STYLES = (
+    (80, "green", "#d4edda"),
+    (50, "orange", "#fff3cd"),
+)
+SCORE_STYLE_LOW = ("red", "#f8d7da")
+
+def _score_style(final_val):
+    """Text and background color of a score card for a final score."""
+    for threshold, color, background in SCORE_STYLES:
+        if final_val > threshold:
+            return color, background
+    return SCORE_STYLE_LOW
+
+def _score_card_html(s):
+    """Render the score card shown under an image; None when the image has no score."""
+    if s["final"] == -999:
+        return None
+    # choose color and border depending on score
+    try:
+        final_val = float(s['final'])
+    except Exception:
+        final_val = -999.0
+    score_color, border_color = _score_style(final_val)
+    try:
+        return f"""
+        <div style="text-align:center; background-color:{border_color}; padding:8px; border-radius:8px; margin-bottom:15px; border:1px solid {score_color};">
+            <div style="font-size:20px; font-weight:bold; color:{score_color};">
+                {final_val:.1f}
+            </div>
+            <div style="font-size:11px; color:#444; margin-top:4px;">
+                CLIP: <b>{float(s.get('clip', 0)):.2f}</b> • Sim: <b>{float(s.get('sim', 0)):.2f}</b>
+            </div>
+            <div style="font-size:11px; color:#d9534f; font-weight:bold;">
+                Penalty: -{float(s.get('geom', 0)):.1f}
+            </div>
+        </div>
+        """
+    except (TypeError, ValueError):
+        return None
+
+@st.cache_data(ttl=300)
+def load_panel_index(view_path: str, signature: tuple) -> dict:
+    """
+    Scan a run folder and parse all of its scores.json files once.
+    `signature` (from _run_signature) is only part of the cache key, so that a new or rewritten
+    image or scores.json in any panel folder busts the cache.
+    Returns {"panels": {panel_name: {"items": [...], "fallback": "onlyname" | "anime" | "none"}},
+             "scores": {(panel_name, variation_id, rank): score dict}}.
+    Each item is {"path", "url", "name", "score", "card"}; "url" is None when the image could not be
+    published under ./static (shown with st.image instead). Ids are parsed from the file name and
+    the score-card HTML is rendered here, once, since scores never change after a run.
+    """
+    panels = {}
+    scores_index = {}
+    use_static = _static_runs_available()
+    for panel_name, entry in _scan_run(view_path).items():
+        if entry["onlyname"]:
+            images, fallback = sorted(entry["onlyname"]), "onlyname"
+        elif entry["anime"]:
+            images, fallback = sorted(entry["anime"]), "anime"
+        else:
+            images, fallback = [], "none"
+        if entry["scores"]:
+            _load_scores(panel_name, entry["scores"], scores_index)
+        items = []
+        for fname, img_path in images:
+            m = _ID_RE.match(fname)
+            # unparseable names keep the default score and sort by name only
+            score = scores_index.get((panel_name, int(m.group(1)), int(m.group(2))), DEFAULT_SCORE) if m else DEFAULT_SCORE
+            url = _publish_static(img_path) if use_static else None
+            items.append({"path": img_path, "url": url, "name": fname, "score": score, "card": _score_card_html(score)})
+        panels[panel_name] = {"items": items, "fallback": fallback}
+    return {"panels": panels, "scores": scores_index}
 
 # --- 3. GENERATION INPUT ---
 st.subheader("1. GENERATION")
-script_text = st.text_area("Script:", value="", height=150)
+# A form only reruns the script on submit, not on every keystroke in the text area
+with st.form("gen_form"):
+    script_text = st.text_area("Script:", value="", height=150)
+    submitted = st.form_submit_button("🚀 Generate Panels", type="primary")
 
-if st.button("🚀 Generate Panels", type="primary"):
+if submitted:
     if not script_text.strip():
         st.warning("Please enter a script first.")
     else:
-        # A. Prepare File
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as f:
-            f.write(script_text)
-            temp_script_path = f.name
-        
-        # B. Prepare Output Path
+        # A. Prepare Output Path
         date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_dir = os.path.join(OUTPUT_ROOT, f"ui_run_{date_str}")
 
         st.info("Running pipeline... (Logs will appear below)")
         
-        # C. Run Pipeline
+        # B. Run Pipeline (the script is piped through stdin, no temp file to clean up)
         command = [
             sys.executable, 
             "src/pipeline.py",
-            "--script_path", temp_script_path,
+            "--script_path", "-",
             "--output_path", output_dir
         ]
         
         try:
-            my_env = os.environ.copy()
-            my_env["PYTHONIOENCODING"] = "utf-8"
-            
             live_log_placeholder = st.empty()
-            full_log_buffer = ""
+            log_buffer = io.StringIO()
+            last_flush = time.monotonic()
 
             process = subprocess.Popen(
                 command,
+                stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
                 text=True,
                 encoding='utf-8',
-                env=my_env,
+                env=_pipeline_env(),
                 bufsize=1
             )
-
-            for line in process.stdout:
-                full_log_buffer += line
-                live_log_placeholder.text_area("Executing...", value=full_log_buffer, height=300)
+            # pipeline.py reads all of stdin before producing any output
+            try:
+                process.stdin.write(script_text)
+                process.stdin.close()
+            except BrokenPipeError:
+                # The pipeline exited before reading all of its input; its output is still read
+                # below and the failure is reported through the exit code
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+            for line_no, line in enumerate(process.stdout, 1):
+                log_buffer.write(line)
+                now = time.monotonic()
+                if now - last_flush > LOG_FLUSH_INTERVAL or line_no % LOG_FLUSH_LINES == 0:
+                    live_log_placeholder.code(log_buffer.getvalue()[-LOG_TAIL_CHARS:])
+                    last_flush = now
 
             process.wait()
 
+            full_log_buffer = log_buffer.getvalue()
+            live_log_placeholder.code(full_log_buffer[-LOG_TAIL_CHARS:])
             st.session_state['generation_log'] = full_log_buffer
 
             if process.returncode != 0:
-                st.error("Pipeline failed. Check the log below.")
+                st.error(f"Pipeline failed (exit code {process.returncode}). Check the log below.")
             else:
                 st.success("Generation Complete!")
                 st.session_state['current_view_path'] = output_dir
+                get_run_folders.clear()  # make the new run show up immediately
                 st.rerun()
 
         except Exception as e:
             st.error(f"Error running pipeline: {e}")
-        
-        if os.path.exists(temp_script_path):
-            os.remove(temp_script_path)
 
 # --- 4. PERSISTENT LOG DISPLAY ---
 if st.session_state['generation_log']:
@@ -109,11 +410,6 @@ st.markdown("---")
 # --- 5. RESULT VIEWER ---
 st.subheader("3. Results Viewer")
 
-def get_run_folders():
-    if not os.path.exists(OUTPUT_ROOT): return []
-    dirs = [d for d in os.listdir(OUTPUT_ROOT) if os.path.isdir(os.path.join(OUTPUT_ROOT, d))]
-    return sorted(dirs, reverse=True)
-
 run_folders = get_run_folders()
 run_options = ["Select a run..."] + run_folders
 
@@ -132,33 +428,79 @@ with col_sel:
     )
 
 if selected_run_name != "Select a run...":
-    view_path = os.path.join(OUTPUT_ROOT, selected_run_name)
+    view_path = f"{OUTPUT_ROOT}{os.sep}{selected_run_name}"
 else:
     view_path = None
+# Checked once per rerun; both the panel viewer and the PDF section use it
+view_path_exists = bool(view_path) and os.path.isdir(view_path)
 
-# CSS fixes
-st.markdown("""
-<style>
-    .stTabs [data-baseweb="tab-list"] { flex-wrap: wrap; gap: 10px; }
-    .stTabs [data-baseweb="tab-highlight"] { display: none; }
-    .stTabs [data-baseweb="tab"] { height: 30px; white-space: pre-wrap; }
-</style>
-""", unsafe_allow_html=True)
-
-st.markdown("""
-<style>
-div[data-testid="stVerticalBlockBorderWrapper"] {
-    border-width: 20px;
-    border-radius: 10px;
-}
-</style>
-""", unsafe_allow_html=True)
+# CSS fixes (one injection per rerun; Streamlit drops elements that a rerun does not emit again)
+st.markdown(VIEWER_CSS, unsafe_allow_html=True)
 
 # -------------------------------
 #     IMAGE LOADING + PER-PANEL FALLBACK
 # -------------------------------
-if view_path and os.path.exists(view_path):
+def _render_panel(panel_name, panel_entry, sort_mode, show_best_only):
+    """Images and score cards of a single panel."""
+    image_list = panel_entry["items"]
+    fallback_used = panel_entry["fallback"]
+
+    # If no images found for this panel, show notice
+    if not image_list:
+        if fallback_used == "none":
+            st.warning(f"No images found for **{panel_name}**.")
+        else:
+            # This branch should not occur since fallback_used would be 'anime' or 'onlyname' when images exist
+            st.warning(f"No images found for **{panel_name}** (fallback attempted: {fallback_used}).")
+        return
+
+    # Display items (with scores) come prebuilt from the cached index
+    display_items = list(image_list)
+
+    # Best-only filter: a single linear scan, no need to sort first
+    if show_best_only:
+        if sort_mode == "Lowest Penalty":
+            best = min(display_items, key=lambda x: x["score"]["geom"])
+        else:
+            best = max(display_items, key=lambda x: x["score"]["final"])
+        display_items = [best]
+    # Sorting
+    elif sort_mode == "Highest Total Score":
+        display_items.sort(key=lambda x: x["score"]["final"], reverse=True)
+    elif sort_mode == "Lowest Penalty":
+        display_items.sort(key=lambda x: x["score"]["geom"])
+    else:
+        display_items.sort(key=lambda x: x["name"])
 
+    # If we used anime fallback for this panel, show an inline warning
+    if fallback_used == "anime":
+        st.warning(f"No `_onlyname.png` images for **{panel_name}** — showing `_anime.png` fallback for this panel.")
+
+    # Display images in 3 columns
+    if not display_items:
+        st.info("No images to show for this panel after filtering.")
+    else:
+        cols = st.columns(3)
+        for j, item in enumerate(display_items):
+            col = cols[j % 3]
+            try:
+                if item["url"]:
+                    col.markdown(
+                        f'<figure style="margin:0;"><img src="{item["url"]}" loading="lazy" style="width:100%;"/>'
+                        f'<figcaption style="text-align:center; font-size:14px; color:#808495;">{html.escape(item["name"])}</figcaption></figure>',
+                        unsafe_allow_html=True
+                    )
+                else:
+                    col.image(item["path"], caption=item["name"], use_container_width=True)
+
+                if item["card"]:
+                    col.markdown(item["card"], unsafe_allow_html=True)
+            except Exception as e:
+                col.error(f"Error: {e}")
+
+@st.fragment
+def render_panel_viewer(view_path, run_name):
+    """Panel viewer for one run; sort/filter/panel changes rerun only this fragment."""
     # --- VIEW SETTINGS ---
     with st.expander("⚙️ View Settings", expanded=True):
         col_sort, col_filter = st.columns(2)
@@ -171,285 +513,110 @@ if view_path and os.path.exists(view_path):
         with col_filter:
             show_best_only = st.checkbox("🏆 Show Only Best Candidate per Panel")
 
-    # ---------- Build panel list from folder names ----------
-    panel_dirs = glob.glob(os.path.join(view_path, "*", "images", "panel*"))
-    panel_names = []
-    for p in panel_dirs:
-        folder = os.path.basename(p)
-        if folder.startswith("panel"):
-            panel_names.append(folder)
-    panel_names = sorted(set(panel_names))
+    # ---------- Build panel index (cached until the run folder changes) ----------
+    panel_index = load_panel_index(view_path, _run_signature(view_path))
+    panel_names = sorted(panel_index["panels"])
 
     if not panel_names:
-        st.warning(f"No panel folders found in `{selected_run_name}`.")
+        st.warning(f"No panel folders found in `{run_name}`.")
     else:
-        # For each panel, try per-panel fallback
-        panel_groups = {}             # panel_name -> list of image paths
-        panel_fallbacks = {}          # panel_name -> "onlyname" | "anime" | "none"
-
-        for panel_name in panel_names:
-            # Determine the folder for this panel
-            panel_dir = os.path.join(view_path, "*", "images", panel_name)
-            # glob to match possible nested structure (some runs may have different nesting)
-            matched_dirs = glob.glob(panel_dir)
-            images = []
-            fallback = "none"
-            if matched_dirs:
-                # use first matched dir (expected to be one)
-                pdir = matched_dirs[0]
-                onlyname_pattern = os.path.join(pdir, "*_onlyname.png")
-                anime_pattern = os.path.join(pdir, "*_anime.png")
-
-                images = sorted(glob.glob(onlyname_pattern))
-                if images:
-                    fallback = "onlyname"
-                else:
-                    images = sorted(glob.glob(anime_pattern))
-                    if images:
-                        fallback = "anime"
-                    else:
-                        images = []
-                        fallback = "none"
-            else:
-                # If there is no images/ panel folder found due to unexpected structure,
-                # attempt looser search across any subfolders of the run
-                loose_only = glob.glob(os.path.join(view_path, "**", panel_name, "*_onlyname.png"), recursive=True)
-                if loose_only:
-                    images = sorted(loose_only)
-                    fallback = "onlyname"
-                else:
-                    loose_anime = glob.glob(os.path.join(view_path, "**", panel_name, "*_anime.png"), recursive=True)
-                    if loose_anime:
-                        images = sorted(loose_anime)
-                        fallback = "anime"
-                    else:
-                        images = []
-                        fallback = "none"
-
-            panel_groups[panel_name] = images
-            panel_fallbacks[panel_name] = fallback
-
-        # Create tabs for every panel (even empty ones)
-        tabs = st.tabs(panel_names)
-
-        # Panel name regex for extracting ids from filenames
-        panel_pattern = re.compile(r"(panel\d+)")
-
-        for i, panel_name in enumerate(panel_names):
-            with tabs[i]:
-                image_list = panel_groups.get(panel_name, [])
-                fallback_used = panel_fallbacks.get(panel_name, "none")
-
-                # Determine the panel image directory for scores.json lookup
-                # find a candidate directory that contains this panel
-                candidate_dirs = glob.glob(os.path.join(view_path, "*", "images", panel_name))
-                panel_img_dir = candidate_dirs[0] if candidate_dirs else None
-                # If not found, attempt recursive search
-                if not panel_img_dir:
-                    rec = glob.glob(os.path.join(view_path, "**", panel_name), recursive=True)
-                    panel_img_dir = rec[0] if rec else None
-
-                # Load scores.json if present in panel image dir
-                scores_map = {}
-                if panel_img_dir:
-                    score_file = os.path.join(panel_img_dir, "scores.json")
-                    if os.path.exists(score_file):
-                        try:
-                            with open(score_file, "r", encoding="utf-8") as f:
-                                data = json.load(f)
-                                for var in data.get("variations", []):
-                                    v_id = var.get("variation_id")
-                                    clip = var.get("clip_score", 0.0)
-                                    for layout in var.get("layout_options", []):
-                                        rank = layout.get("rank")
-                                        scores_map[(v_id, rank)] = {
-                                            "final": layout.get("final_score", -999),
-                                            "clip": clip,
-                                            "sim": layout.get("sim_score", 0),
-                                            "geom": layout.get("geom_penalty", 999)
-                                        }
-                        except Exception:
-                            # ignore score parsing errors
-                            pass
-
-                # If no images found for this panel, show notice but keep tab visible
-                if not image_list:
-                    if fallback_used == "none":
-                        st.warning(f"No images found for **{panel_name}**.")
-                    else:
-                        # This branch should not occur since fallback_used would be 'anime' or 'onlyname' when images exist
-                        st.warning(f"No images found for **{panel_name}** (fallback attempted: {fallback_used}).")
-                    # continue to next tab (keeps the tab visible)
-                    continue
-
-                # Build display items with scores
-                display_items = []
-                for img_path in image_list:
-                    try:
-                        fname = os.path.basename(img_path)
-                        parts = fname.split("_")
-                        # attempt parsing var and rank; fallback to name-based sorting if parse fails
-                        var_id = int(parts[0]) if parts and parts[0].isdigit() else None
-                        rank_id = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
-                        
-                        # if parse succeeded and scores available, pick them; else default
-                        s = {"final": -999, "clip": 0, "sim": 0, "geom": 0}
-                        if var_id is not None and rank_id is not None:
-                            s = scores_map.get((var_id, rank_id), s)
-                        
-                        display_items.append({
-                            "path": img_path,
-                            "name": fname,
-                            "score": s
-                        })
-                    except Exception:
-                        # if anything unexpected in filename, still include image with default score
-                        display_items.append({
-                            "path": img_path,
-                            "name": os.path.basename(img_path),
-                            "score": {"final": -999, "clip": 0, "sim": 0, "geom": 0}
-                        })
-
-                # Sorting
-                if sort_mode == "Highest Total Score":
-                    display_items.sort(key=lambda x: x["score"]["final"], reverse=True)
-                elif sort_mode == "Lowest Penalty":
-                    display_items.sort(key=lambda x: x["score"]["geom"])
-                else:
-                    display_items.sort(key=lambda x: x["name"])
-
-                # Best-only filter
-                if show_best_only and display_items:
-                    if sort_mode == "Lowest Penalty":
-                        best = min(display_items, key=lambda x: x["score"]["geom"])
-                    else:
-                        best = max(display_items, key=lambda x: x["score"]["final"])
-                    display_items = [best]
-
-                # If we used anime fallback for this panel, show an inline warning
-                if fallback_used == "anime":
-                    st.warning(f"No `_onlyname.png` images for **{panel_name}** — showing `_anime.png` fallback for this panel.")
-
-                # Display images in 3 columns
-                if not display_items:
-                    st.info("No images to show for this panel after filtering.")
-                else:
-                    cols = st.columns(3)
-                    for j, item in enumerate(display_items):
-                        col = cols[j % 3]
-                        s = item["score"]
-                        
-                        try:
-                            col.image(item["path"], caption=item["name"], use_container_width=True)
-                            
-                            if s["final"] != -999:
-                                # choose color and border depending on score
-                                try:
-                                    final_val = float(s['final'])
-                                except Exception:
-                                    final_val = -999.0
-                                score_color = "green" if final_val > 80 else "orange" if final_val > 50 else "red"
-                                border_color = "#d4edda" if final_val > 80 else "#fff3cd" if final_val > 50 else "#f8d7da"
-                                
-                                col.markdown(f"""
-                                <div style="text-align:center; background-color:{border_color}; padding:8px; border-radius:8px; margin-bottom:15px; border:1px solid {score_color};">
-                                    <div style="font-size:20px; font-weight:bold; color:{score_color};">
-                                        {final_val:.1f}
-                                    </div>
-                                    <div style="font-size:11px; color:#444; margin-top:4px;">
-                                        CLIP: <b>{float(s.get('clip', 0)):.2f}</b> • Sim: <b>{float(s.get('sim', 0)):.2f}</b>
-                                    </div>
-                                    <div style="font-size:11px; color:#d9534f; font-weight:bold;">
-                                        Penalty: -{float(s.get('geom', 0)):.1f}
-                                    </div>
-                                </div>
-                                """, unsafe_allow_html=True)
-                        except Exception as e:
-                            col.error(f"Error: {e}")
+        # Only the selected panel is rendered; building every tab would decode all images each rerun
+        active_panel = st.radio("Panel:", panel_names, horizontal=True, key=f"active_panel_{run_name}")
+        _render_panel(active_panel, panel_index["panels"][active_panel], sort_mode, show_best_only)
 
-# --- PDF PREVIEW & DOWNLOAD ---
-st.subheader("Manga PDF Preview / Download")
+if view_path_exists:
+    render_panel_viewer(view_path, selected_run_name)
 
-if view_path and os.path.exists(view_path):
-    
-    # 1. LOCATE FILES
-    # Find Old PDF (manga.pdf)
-    old_pdf_path = None
-    old_candidates = glob.glob(os.path.join(view_path, "*", "manga.pdf"))
-    if old_candidates:
-        old_pdf_path = old_candidates[0]
-
-    # Find New PDF (Manga_Chapter_*.pdf)
-    new_pdf_path = None
-    new_candidates = glob.glob(os.path.join(view_path, "Manga_Chapter_*.pdf"))
-    if not new_candidates:
-        # Fallback search if recursively hidden
-        new_candidates = glob.glob(os.path.join(view_path, "**", "Manga_Chapter_*.pdf"), recursive=True)
-    if new_candidates:
-        new_pdf_path = new_candidates[0]
+# --- PDF PREVIEW & DOWNLOAD ---
+@st.cache_data(ttl=3600, show_spinner=False)
+def _read_pdf(pdf_path, mtime_ns):
+    """PDF bytes for download; `mtime_ns` only keys the cache so a rewritten file is re-read."""
+    with open(pdf_path, "rb") as f:
+        return f.read()
+
+def _pdf_download_button(pdf_path, label, file_name, too_small_msg, read_error):
+    try:
+        stat = os.stat(pdf_path)
+        if stat.st_size < 1500:
+            st.error(too_small_msg)
+        else:
+            st.download_button(
+                label=label,
+                data=_read_pdf(pdf_path, stat.st_mtime_ns),
+                file_name=file_name,
+                mime="application/pdf"
+            )
+    except Exception as e:
+        st.error(f"{read_error}: {e}")
 
-    # 2. DOWNLOAD BUTTONS (Side by Side)
+@st.fragment
+def render_pdf_downloads(old_pdf_path, new_pdf_path):
+    """Download buttons; the bytes are read once per file version, not on every rerun."""
     col_d1, col_d2 = st.columns(2)
-    
+
     with col_d1:
         if old_pdf_path:
-            try:
-                with open(old_pdf_path, "rb") as f:
-                    old_bytes = f.read()
-                if len(old_bytes) < 1500:
-                    st.error("⚠️ Found manga.pdf but it's EMPTY or CORRUPTED.")
-                else:
-                    st.download_button(
-                        label="📥 Download Manga PDF (Grid)",
-                        data=old_bytes,
-                        file_name="manga.pdf",
-                        mime="application/pdf"
-                    )
-            except Exception as e:
-                st.error(f"Error reading manga.pdf: {e}")
+            _pdf_download_button(
+                old_pdf_path, "📥 Download Manga PDF (Grid)", "manga.pdf",
+                "⚠️ Found manga.pdf but it's EMPTY or CORRUPTED.", "Error reading manga.pdf"
+            )
         else:
             st.warning("Manga PDF (manga.pdf) not found.")
 
     with col_d2:
         if new_pdf_path:
-            try:
-                with open(new_pdf_path, "rb") as f:
-                    new_bytes = f.read()
-                if len(new_bytes) < 1500:
-                    st.error("⚠️ Found Manga_Chapter_*.pdf but it's very small / possibly corrupted.")
-                else:
-                    st.download_button(
-                        label="📥 Download Stylized Manga PDF (Layout)",
-                        data=new_bytes,
-                        file_name="manga_layout.pdf",
-                        mime="application/pdf"
-                    )
-            except Exception as e:
-                st.error(f"Error reading stylized PDF: {e}")
+            _pdf_download_button(
+                new_pdf_path, "📥 Download Stylized Manga PDF (Layout)", "manga_layout.pdf",
+                "⚠️ Found Manga_Chapter_*.pdf but it's very small / possibly corrupted.", "Error reading stylized PDF"
+            )
         else:
             st.warning("Stylized Manga PDF (Manga_Chapter_*.pdf) not found.")
 
-    st.markdown("---")
+def _show_pdf(pdf_path, name):
+    """Preview a PDF with streamlit_pdf_viewer when installed, else as an embedded iframe."""
+    if os.path.getsize(pdf_path) < 1500:
+        st.error(f"⚠️ Cannot display {name} — it is corrupted.")
+        return
+    try:
+        if pdf_viewer is not None:
+            pdf_viewer(pdf_path, height=500, width=1000)
+        else:
+            with open(pdf_path, "rb") as f:
+                base64_pdf = base64.b64encode(f.read()).decode('utf-8')
+            pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800" type="application/pdf"></iframe>'
+            st.markdown(pdf_display, unsafe_allow_html=True)
+    except Exception as e:
+        st.error(f"Error displaying {name}: {e}")
 
+st.subheader("Manga PDF Preview / Download")
 
-# 3. DISPLAY OLD PDF RESULT
+if view_path_exists:
+    
+    # 1. LOCATE FILES
+    # Find Old PDF (manga.pdf), one folder below the run like the original glob("*/manga.pdf")
+    old_pdf_path = _find_pdf(view_path, lambda name: name == "manga.pdf", min_depth=1, max_depth=1)
+
+    # Find New PDF (Manga_Chapter_*.pdf): the run folder first, then recursively in case it is nested
+    new_pdf_path = _find_pdf(
+        view_path, lambda name: name.startswith("Manga_Chapter_") and name.endswith(".pdf")
+    )
+
+    # 2. DOWNLOAD BUTTONS (Side by Side)
+    render_pdf_downloads(old_pdf_path, new_pdf_path)
+
+    st.markdown("---")
+
+    # 3. DISPLAY OLD PDF RESULT
     if old_pdf_path:
-        print(old_pdf_path)
         st.markdown("### Manga PDF Result")
-        try:
-            pdf_viewer(old_pdf_path, height=500,width=1000)
-        except Exception as e:
-            st.error(f"Error displaying Old PDF: {e}")
+        _show_pdf(old_pdf_path, "manga.pdf")
     
     st.markdown("---")
 
     # 4. DISPLAY NEW PDF RESULT
     if new_pdf_path:
         st.markdown("### Stylized Manga PDF Result")
-        try:
-            pdf_viewer(new_pdf_path, height=500,width=1000)
-        except Exception as e:
-            st.error(f"Error displaying New PDF: {e}")
+        _show_pdf(new_pdf_path, "stylized PDF")
 
 else:
     st.info("No run folder selected.")
@@ -197,14 +197,14 @@ if st.button("Run Full Pipeline", type="primary"):
                         st.markdown(f"**Person {i}**")
                         
                         # Handle typos in lib/image/controlnet.py gracefully
-                        left_hand = getattr(person, 'hand_left_keypoints_2d', None) or getattr(person, 'hand_left_keyopints_2d', None)
-                        right_hand = getattr(person, 'hand_right_keypoints_2d', None) or getattr(person, 'hand_right_keyoints_2d', None)
+                        left_hand = person.hand_left_keypoints_2d
+                        right_hand = person.hand_right_keypoints_2d
                         
                         keypoint_data = {
-                            "Body (Pose)": str(person.pose_keypoints_2d[:3]) + "..." if person.pose_keypoints_2d else "None",
-                            "Face": str(person.face_keypoints_2d[:3]) + "..." if person.face_keypoints_2d else "None",
-                            "Left Hand": str(left_hand[:3]) + "..." if left_hand else "None",
-                            "Right Hand": str(right_hand[:3]) + "..." if right_hand else "None"
+                            "Body (Pose)": str(person.pose_keypoints_2d[:3].tolist()) + "..." if len(person.pose_keypoints_2d) else "None",
+                            "Face": str(person.face_keypoints_2d[:3].tolist()) + "..." if len(person.face_keypoints_2d) else "None",
+                            "Left Hand": str(left_hand[:3].tolist()) + "..." if len(left_hand) else "None",
+                            "Right Hand": str(right_hand[:3].tolist()) + "..." if len(right_hand) else "None"
                         }
                         st.json(keypoint_data)
                 # -------------------------------
@@ -1,18 +1,45 @@
-from typing import List, Optional, Tuple
+from typing import List, Optional
 import io
 from tqdm import tqdm
 import os
 import base64
 import json
+import copy
+import functools
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# One pooled session for every call to the local SD WebUI so connections are kept alive
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+# (connect, read) seconds; generation on the WebUI can take a while
+REQUEST_TIMEOUT = (5, 300)
+
 class People:
+    __slots__ = ("pose_keypoints_2d", "face_keypoints_2d", "hand_left_keypoints_2d", "hand_right_keypoints_2d")
+
     def __init__(self):
-        self.pose_keypoints_2d: Optional[List[Tuple[float, float]]] = None
-        self.face_keypoints_2d: Optional[List[Tuple[float, float]]] = None
-        self.hand_left_keypoints_2d: Optional[List[Tuple[float, float]]] = None
-        self.hand_right_keypoints_2d: Optional[List[Tuple[float, float]]] = None
+        # (N, 2) float32 arrays of (x, y); empty (0, 2) when not detected
+        self.pose_keypoints_2d: Optional[np.ndarray] = None
+        self.face_keypoints_2d: Optional[np.ndarray] = None
+        self.hand_left_keypoints_2d: Optional[np.ndarray] = None
+        self.hand_right_keypoints_2d: Optional[np.ndarray] = None
 
     def __str__(self):
         return f"pose_keypoints_2d={self.pose_keypoints_2d}\n" \
@@ -21,61 +48,85 @@ class People:
                f"hand_right_keypoints_2d={self.hand_right_keypoints_2d}"
 
 class ControlNetResult:
-    def __init__(self, json_response, base_image_path=""):
+    def __init__(self, json_response, base_image_path="", index=0):
         self.canvas_height: int = None
         self.canvas_width: int = None
         self.image: Image = None
         self.people: List[People] = []
         self.base_image_path = base_image_path
-        self._parse_response(json_response)
+        self._parse_response(json_response, index)
 
-    def _parse_response(self, json_response):
-        self.canvas_height = json_response["poses"][0]["canvas_height"]
-        self.canvas_width = json_response["poses"][0]["canvas_width"]
+    def _parse_response(self, json_response, index=0):
+        # A batched detect response holds one pose/image per input image
+        pose = json_response["poses"][index]
+        self.canvas_height = pose["canvas_height"]
+        self.canvas_width = pose["canvas_width"]
 
-        image_base64 = json_response["images"][0]
-        image_bytes = io.BytesIO(base64.b64decode(image_base64))
-        self.image = Image.open(image_bytes)
+        image_base64 = json_response["images"][index]
+        self.image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+        # Decode now so the base64 payload and response dict can be freed
+        self.image.load()
 
         def parse_keypoints(keypoints):
             if keypoints is None:
-                return []
-            return [(keypoints[i], keypoints[i + 1]) for i in range(0, len(keypoints), 3)]
+                return np.empty((0, 2), dtype=np.float32)
+            # OpenPose packs (x, y, confidence) triples; keep x and y only
+            return np.asarray(keypoints, dtype=np.float32).reshape(-1, 3)[:, :2]
 
-        num_people = len(json_response["poses"][0]["people"])
-        for i in range(num_people):
+        for p in pose["people"]:
             person = People()
-            p = json_response["poses"][0]["people"][i]
             person.pose_keypoints_2d = parse_keypoints(p.get("pose_keypoints_2d"))
             person.face_keypoints_2d = parse_keypoints(p.get("face_keypoints_2d"))
             person.hand_left_keypoints_2d = parse_keypoints(p.get("hand_left_keypoints_2d"))
             person.hand_right_keypoints_2d = parse_keypoints(p.get("hand_right_keypoints_2d"))
             self.people.append(person)
 
+def _reduce_bboxes(pts):
+    # pts: (P, K, 2) keypoints padded with (0, 0); returns (P, 4) boxes and a per-person valid flag
+    out = np.zeros((pts.shape[0], 4), dtype=np.int64)
+    valid = np.zeros(pts.shape[0], dtype=np.bool_)
+    for p in range(pts.shape[0]):
+        x1, y1, x2, y2 = np.inf, np.inf, -np.inf, -np.inf
+        for k in range(pts.shape[1]):
+            x, y = pts[p, k, 0], pts[p, k, 1]
+            if x == 0 and y == 0:
+                continue
+            valid[p] = True
+            x1, y1 = min(x1, x), min(y1, y)
+            x2, y2 = max(x2, x), max(y2, y)
+        if valid[p]:
+            out[p, 0], out[p, 1], out[p, 2], out[p, 3] = int(x1), int(y1), int(x2), int(y2)
+    return out, valid
+
+# Only worth it compiled; without numba controlnet2bboxes uses per-person NumPy reductions
+_reduce_bboxes_jit = njit(cache=True)(_reduce_bboxes) if njit is not None else None
+
 def controlnet2bboxes(controlnet_results: ControlNetResult):
     width, height = controlnet_results.canvas_width, controlnet_results.canvas_height
     raw_bboxes = []
 
-    for person in controlnet_results.people:
-        if not person.pose_keypoints_2d:
-            continue
-        x1, y1 = float('inf'), float('inf')
-        x2, y2 = 0, 0
-        for keypoint in person.pose_keypoints_2d:
-            if keypoint[0] == 0 and keypoint[1] == 0:
+    people_pts = [person.pose_keypoints_2d for person in controlnet_results.people
+                  if person.pose_keypoints_2d is not None and len(person.pose_keypoints_2d) > 0]
+    if _reduce_bboxes_jit is not None and people_pts:
+        stacked = np.zeros((len(people_pts), max(len(pts) for pts in people_pts), 2), dtype=np.float32)
+        for i, pts in enumerate(people_pts):
+            stacked[i, :len(pts)] = pts
+        boxes, valid = _reduce_bboxes_jit(stacked)
+        raw_bboxes = boxes[valid].tolist()
+    else:
+        for pts in people_pts:
+            # (0, 0) marks an undetected keypoint
+            pts = pts[(pts != 0).any(axis=1)]
+            if len(pts) == 0:
                 continue
-            x1 = min(x1, keypoint[0])
-            y1 = min(y1, keypoint[1])
-            x2 = max(x2, keypoint[0])
-            y2 = max(y2, keypoint[1])
-        raw_bboxes.append([int(x1), int(y1), int(x2), int(y2)])
+            m = pts.min(axis=0)
+            M = pts.max(axis=0)
+            raw_bboxes.append([int(m[0]), int(m[1]), int(M[0]), int(M[1])])
 
     # Clean invalid boxes
     cleaned = []
     for b in raw_bboxes:
         x1, y1, x2, y2 = b
-        if x1 == float('inf') or y1 == float('inf'):
-            continue
         if (x2 - x1) < 30 or (y2 - y1) < 30:
             continue
         if x2 <= x1 or y2 <= y1:
@@ -89,39 +140,104 @@ def controlnet2bboxes(controlnet_results: ControlNetResult):
 
     return cleaned
 
-def detect_human(image_dir):
+def _file_key(path):
+    # mtime and size are only part of the cache keys so a rewritten file is read again
+    st = os.stat(path)
+    return path, st.st_mtime_ns, st.st_size
+
+# Encoded images are large, so only the few most recent ones (a detect batch, a retry) are kept
+@functools.lru_cache(maxsize=16)
+def _b64_of(path, mtime_ns, size):
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+def _b64_file(path):
+    return _b64_of(*_file_key(path))
+
+@functools.lru_cache(maxsize=4096)
+def _digest_of(path, mtime_ns, size):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).digest()
+
+def _file_digest(path):
+    """sha1 of the raw file bytes, used to send byte-identical images only once."""
+    return _digest_of(*_file_key(path))
+
+def _is_valid_image(path):
+    # verify() checks the file structure without decoding pixels
+    try:
+        with Image.open(path) as im:
+            im.verify()
+        return True
+    except Exception:
+        print(f"[WARN] Skipping unreadable image: {path}")
+        return False
+
+def _detect_batch(filepaths):
+    imgs = [_b64_file(filepath) for filepath in filepaths]
+    payload = {"controlnet_module": "openpose_full", "controlnet_input_images": imgs}
+    response = _json_loads(_SESSION.post("http://127.0.0.1:7860/controlnet/detect", json=payload, timeout=REQUEST_TIMEOUT).content)
+    return [ControlNetResult(response, filepath, i) for i, filepath in enumerate(filepaths)]
+
+def detect_human(image_dir, max_batch_size=8, max_workers=8):
+    # Walk panels and files in name order so results come back in a stable order
+    panel_files = {}
+    with os.scandir(image_dir) as it:
+        panel_entries = sorted((entry for entry in it if entry.is_dir()), key=lambda entry: entry.name)
+    for panel_entry in panel_entries:
+        with os.scandir(panel_entry.path) as it:
+            filepaths = sorted(entry.path for entry in it if entry.is_file())
+        panel_files[panel_entry.name] = [filepath for filepath in filepaths if _is_valid_image(filepath)]
+
+    # Byte-identical images are detected once; only the unique files are ever base64-encoded
+    digests = {}
+    unique = {}
+    for filepaths in panel_files.values():
+        for filepath in filepaths:
+            digest = _file_digest(filepath)
+            digests[filepath] = digest
+            unique.setdefault(digest, filepath)
+
+    # Send up to max_batch_size images per request instead of one POST per image
+    unique_paths = list(unique.values())
+    batches = [unique_paths[start:start + max_batch_size] for start in range(0, len(unique_paths), max_batch_size)]
+
+    # Requests are I/O bound, so keep several in flight against the WebUI
+    detected = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch, results in tqdm(zip(batches, executor.map(_detect_batch, batches)), total=len(batches), desc="Processing Panels for detect human"):
+            for filepath, result in zip(batch, results):
+                detected[digests[filepath]] = result
+
     results_dict = {}
-    for panel_name in tqdm(os.listdir(image_dir), desc="Processing Panels for detect human"):
-        panel_dir = os.path.join(image_dir, panel_name)
+    for panel_name, filepaths in panel_files.items():
         results = []
-        for filename in os.listdir(panel_dir):
-            filepath = os.path.join(panel_dir, filename)
-            with open(filepath, "rb") as f:
-                img_data = base64.b64encode(f.read()).decode("utf-8")
-            payload = {"controlnet_module": "openpose_full", "controlnet_input_images": [img_data]}
-            response = requests.post("http://127.0.0.1:7860/controlnet/detect", json=payload).json()
-            contrlnet_res = ControlNetResult(response, filepath)
-            results.append(contrlnet_res)
+        for filepath in filepaths:
+            result = detected[digests[filepath]]
+            if result.base_image_path != filepath:
+                result = copy.copy(result)
+                result.base_image_path = filepath
+            results.append(result)
         results_dict[panel_name] = results
     return results_dict
 
 def run_controlnet_openpose(image_path, controlnetres_image_path=None, output_path=None):
-    with open(image_path, "rb") as f:
-        img_data = base64.b64encode(f.read()).decode("utf-8")
+    img_data = _b64_file(image_path)
     payload = {"controlnet_module": "openpose_full", "controlnet_input_images": [img_data]}
-    response = requests.post("http://127.0.0.1:7860/controlnet/detect", json=payload).json()
+    content = _SESSION.post("http://127.0.0.1:7860/controlnet/detect", json=payload, timeout=REQUEST_TIMEOUT).content
+    response = _json_loads(content)
     if output_path is not None:
+        # Keep the server's bytes as-is rather than re-serializing megabytes of base64 with indent
         os.makedirs(output_path, exist_ok=True)
-        with open(os.path.join(output_path, "response.json"), "w") as f:
-            json.dump(response, f, indent=2)
+        with open(os.path.join(output_path, "response.json"), "wb") as f:
+            f.write(content)
     return ControlNetResult(response, controlnetres_image_path)
 
 def generate_with_controlnet_openpose(pose_image_path, prompt, save_path, model="tAnimeV4Pruned_v20", width=512, height=512):
     negative_prompt = (
         "nsfw, (photorealistic:1.5), (color:1.5), (shading:1.4), (smooth:1.4), 3d, render,non-overlapping "
     )
-    with open(pose_image_path, "rb") as f:
-        img_data = base64.b64encode(f.read()).decode("utf-8")
+    img_data = _b64_file(pose_image_path)
     payload = {
         "prompt": prompt,
         "negative_prompt": negative_prompt,
@@ -146,16 +262,26 @@ def generate_with_controlnet_openpose(pose_image_path, prompt, save_path, model=
             }
         }
     }
-    response = requests.post("http://127.0.0.1:7860/sdapi/v1/txt2img", json=payload).json()
+    response = _json_loads(_SESSION.post("http://127.0.0.1:7860/sdapi/v1/txt2img", json=payload, timeout=REQUEST_TIMEOUT).content)
     image_base64 = response["images"][0]
     image_bytes = io.BytesIO(base64.b64decode(image_base64))
     image = Image.open(image_bytes)
     image.save(save_path)
 
+# Reachability of the WebUI is re-probed at most once per TTL
+SERVER_STATUS_TTL = 30.0
+_SERVER_STATUS = None  # (time.monotonic() of the probe, reachable)
+
 def check_open():
+    global _SERVER_STATUS
+    now = time.monotonic()
+    if _SERVER_STATUS is not None and now - _SERVER_STATUS[0] < SERVER_STATUS_TTL:
+        return _SERVER_STATUS[1]
     url = "http://127.0.0.1:7860"
     try:
-        response = requests.get(url, timeout=2)
-        return response.status_code == 200
+        response = _SESSION.get(url, timeout=2)
+        ok = response.status_code == 200
     except requests.exceptions.RequestException:
-        return False
+        ok = False
+    _SERVER_STATUS = (now, ok)
+    return ok
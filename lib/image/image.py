@@ -3,45 +3,75 @@ import io
 from PIL import Image
 import base64
 import json
+import random
+import shutil
 import time
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from lib.image.prompt import generate_prompt_prompt, enhancement_prompt
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Pooled session shared by the SD WebUI calls and the DALL·E image downloads
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+_SESSION.mount("http://", _adapter)
+_SESSION.mount("https://", _adapter)
+# (connect, read) seconds
+REQUEST_TIMEOUT = (5, 300)
+
+# Per-process GPT results keyed by the request text, so repeated prompts cost one call
+_ENHANCE_CACHE = {}
+_PANEL_PROMPT_CACHE = {}
+
+# Exponential backoff between retries: 0.5s, 1s, 2s, ... capped at 8s, plus jitter
+RETRY_BASE_WAIT = 0.5
+RETRY_MAX_WAIT = 8
+
+def _retry(fn, num_retry, error_message):
+    for attempt in range(num_retry):
+        try:
+            return fn()
+        except Exception as e:
+            print(f"Retry {attempt+1}/{num_retry} failed: {e}")
+            if attempt + 1 < num_retry:
+                time.sleep(min(RETRY_MAX_WAIT, RETRY_BASE_WAIT * 2 ** attempt) + random.uniform(0, 0.25))
+    raise Exception(error_message)
+
+def _chat(client, messages):
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=messages,
+        temperature=0.0
+    )
+    return response.choices[0].message.content
+
 # -------------------------------
 # Enhance prompts using GPT-4o
 # -------------------------------
 def enhance_prompts(client, prompts, output_path):
     output_file = os.path.join(output_path, "enhanced_image_prompts.json")
     if os.path.exists(output_file):
-        with open(output_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(output_file, "rb") as f:
+            return _json_loads(f.read())
 
     new_prompts = []
     for prompt in tqdm(prompts, desc="Enhancing prompts"):
+        if prompt in _ENHANCE_CACHE:
+            new_prompts.append(_ENHANCE_CACHE[prompt])
+            continue
         messages = [
             {"role": "system", "content": enhancement_prompt},
             {"role": "user", "content": prompt},
         ]
-        max_retry = 3
-        for attempt in range(max_retry):
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=messages,
-                    temperature=0.0
-                )
-                result = response.choices[0].message.content
-                new_prompts.append(result)
-                break
-            except json.JSONDecodeError as e:
-                print(f"JSONDecodeError: {e}")
-                time.sleep(1)
-            except Exception as e:
-                print(f"Error: {e}")
-                time.sleep(1)
-        else:
-            raise Exception("Failed to enhance prompt")
+        result = _retry(lambda: _chat(client, messages), 3, "Failed to enhance prompt")
+        _ENHANCE_CACHE[prompt] = result
+        new_prompts.append(result)
     
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(new_prompts, f, ensure_ascii=False, indent=4)
@@ -53,89 +83,84 @@ def enhance_prompts(client, prompts, output_path):
 def generate_image_prompts(client, panels, speakers, output_path, max_retry=3):
     output_file = os.path.join(output_path, "image_prompts.json")
     if os.path.exists(output_file):
-        with open(output_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(output_file, "rb") as f:
+            return _json_loads(f.read())
 
     # Step 1: Romanize speakers
     messages = [
         {"role": "system", "content": "Convert these names to Japanese Romanization. Return as [name1, name2,...]"},
         {"role": "user", "content": json.dumps(speakers)},
     ]
-    roman_names = []
-    for attempt in range(max_retry):
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                temperature=0.0
-            )
-            roman_names = json.loads(response.choices[0].message.content)
-            break
-        except Exception as e:
-            print(f"Retry {attempt+1}/{max_retry} failed: {e}")
-            time.sleep(1)
+    try:
+        roman_names = _retry(lambda: json.loads(_chat(client, messages)), max_retry, "Failed to romanize speakers")
+    except Exception as e:
+        print(e)
+        roman_names = []
     print(f"Romanization: {roman_names}")
 
     # Step 2: Generate prompts for each panel
+    # Finished panels are appended to a JSONL file so a crashed run resumes where it stopped
+    progress_file = os.path.splitext(output_file)[0] + ".jsonl"
     prompts = []
-    for i, panel in enumerate(panels):
-        descriptions = [d for d in panel if d["type"] == "description"]
-        monologues = [m for m in panel if m["type"] == "monologue"]
-        dialogues = [d for d in panel if d["type"] == "dialogue"]
-        additional_guidelines = f"Change letters {speakers} to romanization {roman_names}."
+    if os.path.exists(progress_file):
+        with open(progress_file, "rb") as f:
+            prompts = [_json_loads(line) for line in f if line.strip()]
+    additional_guidelines = f"Change letters {speakers} to romanization {roman_names}."
+    with open(progress_file, "a", encoding="utf-8") as progress:
+        for i, panel in enumerate(panels):
+            if i < len(prompts):
+                continue
+            descriptions, monologues, dialogues = [], [], []
+            by_type = {"description": descriptions, "monologue": monologues, "dialogue": dialogues}
+            for ele in panel:
+                group = by_type.get(ele["type"])
+                if group is not None:
+                    group.append(ele)
 
-        messages = [
-            {"role": "system", "content": generate_prompt_prompt.format(
+            system_prompt = generate_prompt_prompt.format(
                 descriptions=descriptions, 
                 monologues=monologues, 
                 dialogues=dialogues, 
                 additional_guideines=additional_guidelines
-            )}
-        ]
-        for attempt in range(max_retry):
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=messages,
-                    temperature=0.0
-                )
-                prompts.append(response.choices[0].message.content)
-                break
-            except Exception as e:
-                print(f"Retry {attempt+1}/{max_retry} failed: {e}")
-                time.sleep(1)
-        else:
-            raise Exception("Failed to generate image prompts")
-
-        # Save after each panel
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(prompts, f, ensure_ascii=False, indent=4)
+            )
+            messages = [
+                {"role": "system", "content": system_prompt}
+            ]
+            if system_prompt in _PANEL_PROMPT_CACHE:
+                result = _PANEL_PROMPT_CACHE[system_prompt]
+            else:
+                result = _retry(lambda: _chat(client, messages), max_retry, "Failed to generate image prompts")
+                _PANEL_PROMPT_CACHE[system_prompt] = result
+            prompts.append(result)
+            progress.write(json.dumps(result, ensure_ascii=False) + "\n")
+            progress.flush()
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(prompts, f, ensure_ascii=False, indent=4)
+    os.remove(progress_file)
     return prompts
 
 # -------------------------------
 # Generate image using DALL·E 3
 # -------------------------------
 def generate_image(client, prompt, image_path, num_retry=5):
-    for attempt in range(num_retry):
-        try:
-            result = client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size="1024x1024",
-                quality="standard"
-            ).data[0]
-            image_url = result.url
-            img_response = requests.get(image_url, stream=True)
-            if img_response.status_code == 200:
-                with open(image_path, "wb") as f:
-                    for chunk in img_response.iter_content(1024):
-                        f.write(chunk)
-                break
-        except Exception as e:
-            print(f"Attempt {attempt+1} failed: {e}")
-            time.sleep(1)
-    else:
-        raise Exception("Failed to generate image")
+    def _generate():
+        result = client.images.generate(
+            model="dall-e-3",
+            prompt=prompt,
+            size="1024x1024",
+            quality="standard"
+        ).data[0]
+        image_url = result.url
+        with _SESSION.get(image_url, stream=True, timeout=REQUEST_TIMEOUT) as img_response:
+            if img_response.status_code != 200:
+                raise Exception(f"Image download returned status {img_response.status_code}")
+            # Copy straight from the socket in 64 KiB blocks instead of 1 KiB iter_content chunks
+            img_response.raw.decode_content = True
+            with open(image_path, "wb") as f:
+                shutil.copyfileobj(img_response.raw, f, length=64 * 1024)
+
+    _retry(_generate, num_retry, "Failed to generate image")
 
 # -------------------------------
 # Generate image with local Stable Diffusion
@@ -148,7 +173,7 @@ def generate_image_with_sd(prompt, image_path, width=512, height=512):
         "width": width,
         "height": height,
     }
-    response = requests.post("http://127.0.0.1:7860/sdapi/v1/txt2img", json=payload).json()
+    response = _json_loads(_SESSION.post("http://127.0.0.1:7860/sdapi/v1/txt2img", json=payload, timeout=REQUEST_TIMEOUT).content)
     image_base64 = response["images"][0]
     image_bytes = io.BytesIO(base64.b64decode(image_base64))
     image = Image.open(image_bytes)
@@ -1,14 +1,27 @@
+import functools
 import json
 import os
 from typing import List, Dict
 
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
+from matplotlib.collections import PatchCollection
 from PIL import Image
 
 from lib.layout.score import calc_similarity
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 class Element:
+    __slots__ = ("bbox",)
+    color = None  # edge color used by MangaLayout.plot_data
+    type_code = 0  # small int id used for type masks in score.py
+
     def __init__(self, bbox: List[int]):
         self.bbox = bbox
 
@@ -16,6 +29,10 @@ class Element:
         return (self.bbox[2] - self.bbox[0]) * (self.bbox[3] - self.bbox[1])
 
 class Speaker(Element):
+    __slots__ = ("text_length", "text_info")
+    color = 'red'
+    type_code = 1
+
     def __init__(self, bbox: List[int], text_length: int, text_info=None):
         super().__init__(bbox)
         self.text_length = text_length
@@ -25,6 +42,10 @@ class Speaker(Element):
         return f'Speaker(bbox: {self.bbox}, text_length: {self.text_length})'
 
 class NonSpeaker(Element):
+    __slots__ = ()
+    color = 'blue'
+    type_code = 2
+
     def __init__(self, bbox: List[int]):
         super().__init__(bbox)
 
@@ -32,6 +53,8 @@ class NonSpeaker(Element):
         return f'NonSpeaker(bbox: {self.bbox})'
 
 class MangaLayout:
+    __slots__ = ("image_path", "width", "height", "_elements", "unrelated_text_length", "unrelated_text_bbox", "_arrays")
+
     def __init__(self, image_path: str, width: int, height: int, elements: List[Element], unrelated_text_length: int, unrelated_text_bbox: List[Dict[str, int]]):
         self.image_path = image_path
         self.width = width
@@ -40,6 +63,30 @@ class MangaLayout:
         self.unrelated_text_length = unrelated_text_length
         self.unrelated_text_bbox = unrelated_text_bbox
 
+    @property
+    def elements(self) -> List[Element]:
+        return self._elements
+
+    @elements.setter
+    def elements(self, elements: List[Element]):
+        self._elements = elements
+        self._arrays = None
+
+    def arrays(self):
+        '''
+        スコア計算用に要素のbbox・種類・テキスト長を配列にまとめて返す (elementsの差し替えとadjustで再計算)
+
+        Returns:
+            (bboxes [N, 4] float32, type_codes [N] int8, text_lengths [N] float64)
+        '''
+        if self._arrays is None:
+            elements = self._elements
+            bboxes = np.array([element.bbox for element in elements], dtype=np.float32).reshape(-1, 4)
+            types = np.array([element.type_code for element in elements], dtype=np.int8)
+            text_lengths = np.array([element.text_length if isinstance(element, Speaker) else 0 for element in elements], dtype=np.float64)
+            self._arrays = (bboxes, types, text_lengths)
+        return self._arrays
+
     def adjust(self, base_width: int, base_height: int):
         original_width = self.width
         original_height = self.height
@@ -65,29 +112,31 @@ class MangaLayout:
         
         self.width = base_width
         self.height = base_height
+        # Already at the target size (common for pre-normalized layouts): bboxes stay as they are
+        if abs(total_width_scale - 1.0) < 1e-6 and abs(total_height_scale - 1.0) < 1e-6:
+            return
+        baked = self._arrays
+        self._arrays = None
         
-        for element in self.elements:
-            element.bbox = [
-                int(element.bbox[0] * total_width_scale), 
-                int(element.bbox[1] * total_height_scale),
-                int(element.bbox[2] * total_width_scale),
-                int(element.bbox[3] * total_height_scale)
-            ]
-            if type(element) == Speaker:
-                for text_info in element.text_info:
-                    text_info["bbox"] = [
-                        int(text_info["bbox"][0] * total_width_scale),
-                        int(text_info["bbox"][1] * total_height_scale),
-                        int(text_info["bbox"][2] * total_width_scale),
-                        int(text_info["bbox"][3] * total_height_scale)
-                    ]
-        for text_info in self.unrelated_text_bbox:
-            text_info["bbox"] = [
-                int(text_info["bbox"][0] * total_width_scale),
-                int(text_info["bbox"][1] * total_height_scale),
-                int(text_info["bbox"][2] * total_width_scale),
-                int(text_info["bbox"][3] * total_height_scale)
-            ]
+        # Scale every element, speaker text and unrelated text bbox in one array op
+        texts = [text_info for element in self.elements if isinstance(element, Speaker) for text_info in element.text_info]
+        texts.extend(self.unrelated_text_bbox)
+        boxes = [element.bbox for element in self.elements] + [text_info["bbox"] for text_info in texts]
+        if not boxes:
+            return
+        scale = np.array([total_width_scale, total_height_scale, total_width_scale, total_height_scale])
+        scaled = np.asarray(boxes, dtype=np.float64)
+        np.multiply(scaled, scale, out=scaled)
+        np.trunc(scaled, out=scaled)  # same truncation as int()
+        num_elements = len(self.elements)
+        # Scaling does not change types or text lengths, so the cached arrays only need new bboxes
+        if baked is not None:
+            self._arrays = (scaled[:num_elements].astype(np.float32), baked[1], baked[2])
+        scaled = scaled.astype(np.int64).tolist()
+        for element, bbox in zip(self.elements, scaled[:num_elements]):
+            element.bbox = bbox
+        for text_info, bbox in zip(texts, scaled[num_elements:]):
+            text_info["bbox"] = bbox
 
     def plot_data(self, ax):
         if self.image_path is not None and not self.image_path == "":
@@ -101,12 +150,10 @@ class MangaLayout:
         ax.set_aspect('equal')
         ax.invert_yaxis()
         
-        for element in self.elements:
-            x1, y1, x2, y2 = element.bbox
-            if type(element) == Speaker:
-                ax.add_patch(Rectangle((x1, y1), x2 - x1, y2 - y1, fill=False, edgecolor='red', linewidth=2))
-            elif type(element) == NonSpeaker:
-                ax.add_patch(Rectangle((x1, y1), x2 - x1, y2 - y1, fill=False, edgecolor='blue', linewidth=2))
+        drawn = [element for element in self.elements if element.color is not None]
+        if drawn:
+            rects = [Rectangle((x1, y1), x2 - x1, y2 - y1) for x1, y1, x2, y2 in (element.bbox for element in drawn)]
+            ax.add_collection(PatchCollection(rects, edgecolors=[element.color for element in drawn], facecolors='none', linewidths=2))
 
     def __repr__(self):
         return f'''
@@ -125,15 +172,25 @@ def _generate_layout_from_metadata(metadata: dict):
     speaker_objects = metadata["speaker_objects"]
     non_speaker_objects = metadata["non_speaker_objects"]
     unrelated_text_length = metadata["unrelated_text_length"]
-    unrelated_text_bbox = metadata["unrelated_text_bbox"]
+    # Copy the text dicts: adjust() rewrites their bboxes and the parsed annotation is cached
+    unrelated_text_bbox = [dict(text_info) for text_info in metadata["unrelated_text_bbox"]]
     elements = []
     for speaker_object in speaker_objects:
-        elements.append(Speaker(speaker_object["bbox"], speaker_object["text_length"], speaker_object["text_info"]))
+        text_info = speaker_object["text_info"]
+        if text_info is not None:
+            text_info = [dict(t) for t in text_info]
+        elements.append(Speaker(speaker_object["bbox"], speaker_object["text_length"], text_info))
     for non_speaker_object in non_speaker_objects:
         elements.append(NonSpeaker(non_speaker_object["bbox"]))
     mangalayout = MangaLayout(image_path, width, height, elements, unrelated_text_length, unrelated_text_bbox)
     return mangalayout
 
+@functools.lru_cache(maxsize=8)
+def _load_ann(path: str, mtime: float):
+    # mtime is only part of the cache key so an updated annotation file is re-read
+    with open(path, 'rb') as f:
+        return _json_loads(f.read())
+
 def from_condition(annfile: str, num_speakers: int, num_non_speakers: int, base_text_length: int, text_length_threshold: int, base_width: int, base_height: int, aspect_ratio_threshold: float,  adjust: bool):
     '''
     話者の数の条件に一致するLayoutオブジェクトのリストを生成する
@@ -153,25 +210,34 @@ def from_condition(annfile: str, num_speakers: int, num_non_speakers: int, base_
     if not os.path.isfile(annfile):
         raise IsADirectoryError(f"Annotation file is a directory: {annfile}")
 
-    with open(annfile, 'r', encoding='utf-8') as f:
-        ann = json.load(f)
+    ann = _load_ann(annfile, os.path.getmtime(annfile))
 
     key = f"{num_speakers}_{num_non_speakers}"
 
     if not key in ann:
         raise ValueError(f"Annotation file does not contain key: {key}")
 
-    layouts = []
+    entries = ann[key]
+    if not entries:
+        return []
+
+    # Filter on text length and aspect ratio with array masks; only survivors get a MangaLayout
+    count = len(entries)
+    unrelated_text_lengths = np.fromiter((e['unrelated_text_length'] for e in entries), dtype=np.float64, count=count)
+    widths = np.fromiter((e['width'] for e in entries), dtype=np.float64, count=count)
+    heights = np.fromiter((e['height'] for e in entries), dtype=np.float64, count=count)
+    aspect_ratios = widths / heights
     base_aspect_ratio = base_width / base_height
-    for metadata in ann[key]:
-        unrelated_text_length = metadata['unrelated_text_length']
-        if unrelated_text_length < base_text_length - text_length_threshold or unrelated_text_length > base_text_length + text_length_threshold:
-            continue
-        width, height = metadata['width'], metadata['height']
-        aspect_ratio = width / height
-        if aspect_ratio < base_aspect_ratio - aspect_ratio_threshold or aspect_ratio > base_aspect_ratio + aspect_ratio_threshold:
-            continue
-        layout = _generate_layout_from_metadata(metadata)
+    mask = (
+        (unrelated_text_lengths >= base_text_length - text_length_threshold)
+        & (unrelated_text_lengths <= base_text_length + text_length_threshold)
+        & (aspect_ratios >= base_aspect_ratio - aspect_ratio_threshold)
+        & (aspect_ratios <= base_aspect_ratio + aspect_ratio_threshold)
+    )
+
+    layouts = []
+    for i in np.flatnonzero(mask):
+        layout = _generate_layout_from_metadata(entries[i])
         if adjust:
             layout.adjust(base_width, base_height)
         layouts.append(layout)
@@ -213,9 +279,9 @@ def similar_layouts(layout: MangaLayout, text_length_threshold=5, aspect_ratio_t
     num_non_speakers = 0
     unrelated_text_length = layout.unrelated_text_length
     for element in layout.elements:
-        if type(element) == Speaker:
+        if isinstance(element, Speaker):
             num_speakers += 1
-        elif type(element) == NonSpeaker:
+        elif isinstance(element, NonSpeaker):
             num_non_speakers += 1
     filtered_layouts = from_condition(annfile, num_speakers, num_non_speakers, unrelated_text_length, text_length_threshold, layout.width, layout.height, aspect_ratio_threshold, True)
 
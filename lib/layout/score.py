@@ -1,8 +1,6 @@
-from torchvision.ops import box_iou
 from scipy.optimize import linear_sum_assignment
 from typing import List, Dict, Tuple, Any, Optional
 import numpy as np
-import torch
 import json
 import os
 import math
@@ -13,31 +11,41 @@ import matplotlib.pyplot as plt
 # from lib.layout.layout import MangaLayout, from_condition, Speaker, NonSpeaker
 
 
+def _box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    # torchvision.ops.box_iou と同じ定義を NumPy のブロードキャストで計算 (boxes: [N, 4] x1y1x2y2)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    lt = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    rb = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    union = area1[:, None] + area2[None, :] - inter
+    # 面積0同士のペアはNaN(と警告)ではなく0にする (NaNがあるとlinear_sum_assignmentが失敗する)
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
 def _calc_weight_matrix(layout1, layout2, iou_weight: float):
     # 関数内でインポート
     from lib.layout.layout import Speaker
     
-    boxes1 = torch.tensor([elem.bbox for elem in layout1.elements], dtype=torch.float32)
-    boxes2 = torch.tensor([elem.bbox for elem in layout2.elements], dtype=torch.float32)
+    boxes1, types1, text_len1 = layout1.arrays()
+    boxes2, types2, text_len2 = layout2.arrays()
     
     n = len(boxes1)
     m = len(boxes2)
     if n == 0 or m == 0:
         return None
     
-    weight_matrix = box_iou(boxes1, boxes2).numpy()
-    for i in range(n):
-        for j in range(m):
-            type1 = type(layout1.elements[i])
-            type2 = type(layout2.elements[j])
-            if type1 != type2:
-                weight_matrix[i,j] = 0
-            if type1 == Speaker and type2 == Speaker:
-                text_len1 = layout1.elements[i].text_length
-                text_len2 = layout2.elements[j].text_length
-                sigma = 10 ** 2
-                text_weight = math.exp(-(text_len1 - text_len2)**2 / (2 * sigma))
-                weight_matrix[i,j] = iou_weight * weight_matrix[i,j] + (1 - iou_weight) * text_weight
+    # 種類の異なる要素同士の重みは0
+    same_type = types1[:, None] == types2[None, :]
+    weight_matrix = np.where(same_type, _box_iou(boxes1, boxes2), 0.0)
+
+    # Speaker同士のペアはIoUとテキスト長の近さ(ガウス)をブレンド、行列全体を一括計算
+    is_speaker1 = types1 == Speaker.type_code
+    is_speaker2 = types2 == Speaker.type_code
+    sigma = 10 ** 2
+    text_weight = np.exp(-(text_len1[:, None] - text_len2[None, :]) ** 2 / (2 * sigma))
+    both_speakers = is_speaker1[:, None] & is_speaker2[None, :]
+    weight_matrix = np.where(both_speakers, iou_weight * weight_matrix + (1 - iou_weight) * text_weight, weight_matrix)
 
     return weight_matrix
 
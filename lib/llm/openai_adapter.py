@@ -53,18 +53,13 @@ class GPTClient:
         Simple streaming generator (yields chunks). Useful if any function used streaming.
         """
         messages = [{"role":"user","content":prompt}]
-        stream = self.client.chat.completions.stream(
+        # .stream() returns a context manager yielding typed events; only
+        # "content.delta" events carry text, and their .delta is already a str
+        with self.client.chat.completions.stream(
             model=self.model,
             messages=messages,
             **kwargs
-        )
-        for event in stream:
-            # event may contain delta chunks
-            # yield textual content if present
-            try:
-                for choice in getattr(event, "choices", []):
-                    delta = choice.delta
-                    if delta and "content" in delta:
-                        yield delta["content"]
-            except Exception:
-                pass
+        ) as stream:
+            for event in stream:
+                if event.type == "content.delta" and event.delta:
+                    yield event.delta
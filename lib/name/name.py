@@ -1,5 +1,7 @@
 from PIL import Image, ImageDraw, ImageFont
+import functools
 import os
+import threading
 from lib.layout.layout import MangaLayout, Speaker, NonSpeaker
 from math import atan2, cos, sin, hypot
 import random
@@ -8,17 +10,35 @@ from math import ceil
 FONTPATH = "fonts/NotoSansCJK-Regular.ttc"
 
 
+# TTCの読み込みと文字サイズの計測はサイズごとに一度だけ行う
+# FreeTypeのフォントはスレッド間で共有せず、スレッドごとに保持する（generate_nameは並列に呼ばれる）
+_FONTS = threading.local()
+
+def _get_font(size):
+    fonts = getattr(_FONTS, "by_size", None)
+    if fonts is None:
+        fonts = _FONTS.by_size = {}
+    font = fonts.get(size)
+    if font is None:
+        font = fonts[size] = ImageFont.truetype(FONTPATH, size)
+    return font
+
+
+@functools.lru_cache(maxsize=8)
+def _get_char_metrics(size):
+    char_bbox = _get_font(size).getbbox("あ")
+    return char_bbox[2] - char_bbox[0], char_bbox[3] - char_bbox[1]
+
+
 def draw_vertical_text(img, text, bbox, type):
     draw = ImageDraw.Draw(img)
-    font = ImageFont.truetype(FONTPATH, 20)
+    font = _get_font(20)
     vertical_margin = 2
     horiziontal_margin = 2
     image_width, image_height = img.width, img.height
     width = bbox[2] - bbox[0]
     height = bbox[3] - bbox[1]
-    char_bbox = font.getbbox("あ")
-    char_width = char_bbox[2] - char_bbox[0]
-    char_height = char_bbox[3] - char_bbox[1]
+    char_width, char_height = _get_char_metrics(20)
     chars_per_col = int(height / (char_height + vertical_margin))
 
     estimated_width = char_width * (int((len(text) / chars_per_col)) + 1)
@@ -1,17 +1,15 @@
 #!/usr/bin/env python3
+import io
 import os
 import json
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from PIL import Image
 
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Image as RLImage,
-    Spacer,
-    PageBreak,
-)
+from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
+from reportlab.lib.units import mm, inch
 
 
 # --------------------------------------------------
@@ -24,19 +22,27 @@ def load_winner_images(scoring_dir: str) -> List[str]:
         print("[ERROR] scoring_dir does not exist:", scoring_dir)
         return winners
 
-    panel_dirs = sorted(
-        d for d in os.listdir(scoring_dir)
-        if d.startswith("panel") and os.path.isdir(os.path.join(scoring_dir, d))
-    )
+    with os.scandir(scoring_dir) as it:
+        panel_dirs = sorted(
+            (e.name, e.path) for e in it
+            if e.name.startswith("panel") and e.is_dir()
+        )
+
+    for pdir, panel_path in panel_dirs:
+        # one directory read per panel instead of an exists() stat per candidate file
+        with os.scandir(panel_path) as it:
+            panel_files = {e.name for e in it}
+
+        def _exists(path):
+            if os.path.dirname(path) == panel_path:
+                return os.path.basename(path) in panel_files
+            return os.path.exists(path)
 
-    for pdir in panel_dirs:
-        panel_path = os.path.join(scoring_dir, pdir)
-        scores_path = os.path.join(panel_path, "scores.json")
         final_img = None
 
         # Read winner file
-        if os.path.exists(scores_path):
-            with open(scores_path, "r", encoding="utf-8") as f:
+        if "scores.json" in panel_files:
+            with open(os.path.join(panel_path, "scores.json"), "r", encoding="utf-8") as f:
                 data = json.load(f)
 
             winner = data.get("winner", {})
@@ -51,16 +57,14 @@ def load_winner_images(scoring_dir: str) -> List[str]:
 
                 # Try onlyname
                 onlyname = full_gen_path[:-4] + "_onlyname.png"
-                if os.path.exists(onlyname):
+                if _exists(onlyname):
                     final_img = onlyname
-                elif os.path.exists(full_gen_path):
+                elif _exists(full_gen_path):
                     final_img = full_gen_path
 
         # Fallback → 00_anime.png
-        if final_img is None:
-            fallback = os.path.join(panel_path, "00_anime.png")
-            if os.path.exists(fallback):
-                final_img = fallback
+        if final_img is None and "00_anime.png" in panel_files:
+            final_img = os.path.join(panel_path, "00_anime.png")
 
         if final_img:
             winners.append(final_img)
@@ -70,6 +74,27 @@ def load_winner_images(scoring_dir: str) -> List[str]:
     return winners
 
 
+# --------------------------------------------------
+# PREPARE ONE PANEL IMAGE (runs in worker threads)
+# --------------------------------------------------
+def _prep_panel_image(img_path: str, panel_px: int) -> Optional[io.BytesIO]:
+    try:
+        # load once (no overwriting)
+        img = Image.open(img_path)
+        img = img.convert("RGB")
+        # encode in memory; no _resized_tmp.jpg left next to the panels
+        resized = io.BytesIO()
+        # only shrink; panels already near print size are passed through as-is
+        if max(img.size) > panel_px * 1.1:
+            img.thumbnail((panel_px, panel_px), Image.BICUBIC)
+        img.save(resized, format="JPEG")
+        resized.seek(0)
+        return resized
+    except Exception as e:
+        print("[ERROR] Failed image:", img_path, e)
+        return None
+
+
 # --------------------------------------------------
 # COMPOSE PDF – 2 panels per page
 # --------------------------------------------------
@@ -82,44 +107,48 @@ def compose_manga_pdf(scoring_dir: str, output_pdf: str):
 
     print(f"[COMPOSER] Found {len(winner_images)} panels")
 
-    # PDF setup
-    doc = SimpleDocTemplate(
-        output_pdf,
-        pagesize=A4,
-        leftMargin=10 * mm,
-        rightMargin=10 * mm,
-        topMargin=10 * mm,
-        bottomMargin=10 * mm,
-    )
-
-    story = []
+    # PDF setup: panels are drawn straight onto the canvas page by page,
+    # so only a small window of encoded images is alive at any time
+    pdf = canvas.Canvas(output_pdf, pagesize=A4)
+    page_w, page_h = A4
+    MARGIN = 10 * mm
     PANEL_W = 120 * mm
     PANEL_H = 120 * mm
-
-    for idx, img_path in enumerate(winner_images):
-        try:
-            # load once (no overwriting)
-            img = Image.open(img_path)
-            img = img.convert("RGB")
-            resized_path = img_path + "_resized_tmp.jpg"
-            img.resize((1024, 1024), Image.BICUBIC).save(resized_path)
-        except Exception as e:
-            print("[ERROR] Failed image:", img_path, e)
-            continue
-
-        story.append(RLImage(resized_path, width=PANEL_W, height=PANEL_H))
-
-        # After two images → new page
-        if idx % 2 == 0:
-            story.append(Spacer(1, 8 * mm))
-        else:
-            story.append(PageBreak())
-
-    # If odd → last pagebreak
-    if len(winner_images) % 2 == 1:
-        story.append(PageBreak())
-
-    doc.build(story)
+    PANEL_GAP = 8 * mm
+    # pixels needed to print a panel at 200 dpi (~945px for 120mm)
+    PANEL_PX = round(max(PANEL_W, PANEL_H) / inch * 200)
+
+    panel_x = (page_w - PANEL_W) / 2
+    top = page_h - MARGIN
+    cursor = top
+    on_page = 0 # panels drawn on the current page (failed panels don't count)
+
+    # decode/resize/encode release the GIL, so panels are prepared in parallel;
+    # work through them in windows so the whole chapter is never held in memory
+    workers = os.cpu_count() or 1
+    window = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(winner_images), window):
+            chunk = winner_images[start:start + window]
+            prepared = executor.map(lambda p: _prep_panel_image(p, PANEL_PX), chunk)
+            for resized in prepared:
+                if resized is None:
+                    continue
+
+                pdf.drawImage(ImageReader(resized), panel_x, cursor - PANEL_H, width=PANEL_W, height=PANEL_H)
+                on_page += 1
+
+                # After two images → new page
+                if on_page < 2:
+                    cursor -= PANEL_H + PANEL_GAP
+                else:
+                    pdf.showPage()
+                    cursor = top
+                    on_page = 0
+
+    if on_page:
+        pdf.showPage()
+    pdf.save()
     print(f"[COMPOSER] PDF created successfully → {output_pdf}")
 
 
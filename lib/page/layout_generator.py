@@ -1,6 +1,268 @@
-import json
-import random
 import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from lib.page.style_model import load_style_model
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Number of random layouts sampled per Monte Carlo search
+MC_ITERATIONS = 1000
+
+# Integer codes used in the structure signature. Tuples of ints hash the same in every
+# process (unlike str, which is salted per interpreter), so worker hashes can be merged.
+_LEAF_CODE = -1
+_SPLIT_CODES = {"H": 0, "V": 1}
+
+
+class _FlatTree:
+    """
+    Sampled layout tree in struct-of-arrays form (one row per node, nodes numbered in pre-order).
+    split[i] is _LEAF_CODE for leaves, otherwise a _SPLIT_CODES value; p_idx[i] is the leaf's
+    position in the panel list. rect[i] holds [x, y, w, h].
+    """
+    __slots__ = ('split', 'left', 'right', 'p_idx', 'rect')
+
+    def __init__(self, split, left, right, p_idx, rect):
+        self.split = np.array(split, dtype=np.int8)
+        self.left = np.array(left, dtype=np.int32)
+        self.right = np.array(right, dtype=np.int32)
+        self.p_idx = np.array(p_idx, dtype=np.int32)
+        self.rect = np.array(rect, dtype=np.float64)
+
+
+def _importance_prefix(panels):
+    # Prefix sums of importance, so the weight of any panel group [lo, hi) is O(1)
+    prefix = [0]
+    for p in panels:
+        prefix.append(prefix[-1] + p.get('importance_score', 5))
+    return prefix
+
+
+def _score_draws(draws, prefix, prob_h, prob_h_fallback, ranks, target_pct, page_w, page_h, rtl, prune):
+    """
+    Numeric twin of _random_tree: replays every tree from its pre-sampled draws and returns
+    the layout costs, without building any tree. Only used compiled (numba).
+
+    The cost ('Badness', lower is better) of a layout is
+    - 50 per panel with aspect ratio outside [0.5, 2], plus 1000 more outside [0.15, 6]
+    - 100 * squared error between the area share of each rank and its importance target
+
+    With prune, a tree is abandoned as soon as its shape penalties reach the best cost so far;
+    its entry is then that partial cost (a lower bound, never below the best).
+    """
+    iterations = draws.shape[0]
+    num_panels = prefix.shape[0] - 1
+    total_area = page_w * page_h
+    costs = np.empty(iterations)
+    best = np.inf
+
+    for it in range(iterations):
+        # Pending groups are disjoint, so the stack never holds more than num_panels entries
+        st_i = np.empty((num_panels, 3), dtype=np.int64) # lo, hi, depth
+        st_f = np.empty((num_panels, 4))                 # x, y, w, h
+        areas = np.empty(num_panels)
+        shape_cost = 0.0
+        pruned = False
+        st_i[0, 0], st_i[0, 1], st_i[0, 2] = 0, num_panels, 0
+        st_f[0, 0], st_f[0, 1], st_f[0, 2], st_f[0, 3] = 0.0, 0.0, page_w, page_h
+        top = 1
+        n_leaf = 0
+        d = 0
+
+        while top > 0:
+            top -= 1
+            lo, hi, depth = st_i[top, 0], st_i[top, 1], st_i[top, 2]
+            x, y, w, h = st_f[top, 0], st_f[top, 1], st_f[top, 2], st_f[top, 3]
+
+            if hi - lo == 1:
+                areas[n_leaf] = w * h
+                n_leaf += 1
+                # Shape penalties are known leaf by leaf, so they are what pruning checks
+                leaf_ratio = w / h if h > 0 else 1.0
+                if leaf_ratio < 0.5 or leaf_ratio > 2.0:
+                    shape_cost += 50
+                if leaf_ratio < 0.15 or leaf_ratio > 6.0:
+                    shape_cost += 1000
+                if prune and shape_cost >= best:
+                    pruned = True
+                    break
+                continue
+
+            p = prob_h[depth] if depth < prob_h.shape[0] else prob_h_fallback
+            is_h = draws[it, d, 0] < p
+            mid = lo + 1 + int(draws[it, d, 1] * (hi - lo - 1))
+            w_tot = prefix[hi] - prefix[lo]
+            target_ratio = (prefix[mid] - prefix[lo]) / w_tot if w_tot > 0 else 0.5
+            ratio = max(0.2, min(0.8, target_ratio + (draws[it, d, 2] - 0.5) * 0.1))
+            d += 1
+
+            # Same push order as _random_tree (right child first), so draws are consumed identically
+            if is_h:
+                st_i[top, 0], st_i[top, 1], st_i[top, 2] = mid, hi, depth + 1
+                st_f[top, 0], st_f[top, 1], st_f[top, 2], st_f[top, 3] = x, y + h * ratio, w, h * (1 - ratio)
+                st_i[top + 1, 0], st_i[top + 1, 1], st_i[top + 1, 2] = lo, mid, depth + 1
+                st_f[top + 1, 0], st_f[top + 1, 1], st_f[top + 1, 2], st_f[top + 1, 3] = x, y, w, h * ratio
+            else:
+                w_a = w * ratio
+                w_b = w * (1 - ratio)
+                if rtl:
+                    st_i[top, 0], st_i[top, 1], st_i[top, 2] = lo, mid, depth + 1
+                    st_f[top, 0], st_f[top, 1], st_f[top, 2], st_f[top, 3] = x + w_b, y, w_a, h
+                    st_i[top + 1, 0], st_i[top + 1, 1], st_i[top + 1, 2] = mid, hi, depth + 1
+                    st_f[top + 1, 0], st_f[top + 1, 1], st_f[top + 1, 2], st_f[top + 1, 3] = x, y, w_b, h
+                else:
+                    st_i[top, 0], st_i[top, 1], st_i[top, 2] = mid, hi, depth + 1
+                    st_f[top, 0], st_f[top, 1], st_f[top, 2], st_f[top, 3] = x + w_a, y, w_b, h
+                    st_i[top + 1, 0], st_i[top + 1, 1], st_i[top + 1, 2] = lo, mid, depth + 1
+                    st_f[top + 1, 0], st_f[top + 1, 1], st_f[top + 1, 2], st_f[top + 1, 3] = x, y, w_a, h
+            top += 2
+
+        if pruned:
+            costs[it] = shape_cost
+            continue
+
+        # Importance cost: areas sorted descending, so index == rank
+        actual_pct = np.sort(areas)[::-1] / total_area
+        cost = 0.0
+        for j in range(ranks.shape[0]):
+            cost += (actual_pct[ranks[j]] - target_pct[j]) ** 2 * 100
+        cost += shape_cost
+        costs[it] = cost
+        if cost < best:
+            best = cost
+
+    return costs
+
+_score_draws_jit = njit(cache=True)(_score_draws) if njit is not None else None
+
+
+def _score_draws_batched(draws, prefix, prob_h, prob_h_fallback, ranks, target_pct, page_w, page_h, rtl):
+    """
+    NumPy version of _score_draws for when numba is unavailable: expands all trees of the batch
+    together, one tree level per step, and scores them in one reduction.
+
+    Draws are still consumed in the pre-order of _random_tree: a left child uses its parent's
+    draw + 1, a right child skips the left subtree's n_left - 1 split nodes.
+    """
+    iterations = draws.shape[0]
+    num_panels = prefix.shape[0] - 1
+    prob_h = np.concatenate([prob_h, np.full(num_panels, prob_h_fallback)]) # depth-indexable up to num_panels
+
+    # Leaf sizes per tree; a leaf's slot is its panel position 'lo'
+    leaf_w = np.empty((iterations, num_panels))
+    leaf_h = np.empty((iterations, num_panels))
+
+    # Pending groups of every tree
+    tree = np.arange(iterations)
+    lo = np.zeros(iterations, dtype=np.int64)
+    hi = np.full(iterations, num_panels, dtype=np.int64)
+    depth = np.zeros(iterations, dtype=np.int64)
+    k = np.zeros(iterations, dtype=np.int64) # pre-order index of the split node = its draw
+    x = np.zeros(iterations)
+    y = np.zeros(iterations)
+    w = np.full(iterations, float(page_w))
+    h = np.full(iterations, float(page_h))
+
+    while tree.size:
+        leaf = hi - lo == 1
+        leaf_w[tree[leaf], lo[leaf]] = w[leaf]
+        leaf_h[tree[leaf], lo[leaf]] = h[leaf]
+
+        node = ~leaf
+        tree, lo, hi, depth, k = tree[node], lo[node], hi[node], depth[node], k[node]
+        x, y, w, h = x[node], y[node], w[node], h[node]
+        if not tree.size:
+            break
+
+        u = draws[tree, k]
+        is_h = u[:, 0] < prob_h[depth]
+        mid = lo + 1 + (u[:, 1] * (hi - lo - 1)).astype(np.int64)
+        w_tot = prefix[hi] - prefix[lo]
+        target_ratio = np.divide(prefix[mid] - prefix[lo], w_tot, out=np.full(tree.size, 0.5), where=w_tot > 0)
+        ratio = np.maximum(0.2, np.minimum(0.8, target_ratio + (u[:, 2] - 0.5) * 0.1))
+
+        # Group A = [lo, mid), Group B = [mid, hi). Children geometry as in _random_tree
+        w_a = w * ratio
+        w_b = w * (1 - ratio)
+        a_first = is_h | (not rtl) # A is the left (pre-order first) child unless it is an RTL vertical cut
+        a_x = np.where(a_first, x, x + w_b)
+        a_y = y
+        a_w = np.where(is_h, w, w_a)
+        a_h = np.where(is_h, h * ratio, h)
+        b_x = np.where(is_h, x, np.where(a_first, x + w_a, x))
+        b_y = np.where(is_h, y + h * ratio, y)
+        b_w = np.where(is_h, w, w_b)
+        b_h = np.where(is_h, h * (1 - ratio), h)
+        n_left = np.where(a_first, mid - lo, hi - mid) # panels under the pre-order first child
+        a_k = np.where(a_first, k + 1, k + n_left)
+        b_k = np.where(a_first, k + n_left, k + 1)
+
+        tree = np.concatenate([tree, tree])
+        lo, hi = np.concatenate([lo, mid]), np.concatenate([mid, hi])
+        depth = np.concatenate([depth + 1, depth + 1])
+        k = np.concatenate([a_k, b_k])
+        x, y = np.concatenate([a_x, b_x]), np.concatenate([a_y, b_y])
+        w, h = np.concatenate([a_w, b_w]), np.concatenate([a_h, b_h])
+
+    # Same cost terms as _score_draws, for every tree at once
+    ratios = np.divide(leaf_w, leaf_h, out=np.ones_like(leaf_w), where=leaf_h > 0)
+    shape_cost = 50 * np.count_nonzero((ratios < 0.5) | (ratios > 2.0), axis=1)
+    shape_cost += 1000 * np.count_nonzero((ratios < 0.15) | (ratios > 6.0), axis=1)
+    actual_pct = -np.sort(-(leaf_w * leaf_h), axis=1) / (page_w * page_h)
+    cost = ((actual_pct[:, ranks] - target_pct) ** 2).sum(axis=1) * 100
+    return cost + shape_cost
+
+
+def _search_worker(layout, panels, iterations, seed, k):
+    """
+    Runs one chunk of the Monte Carlo search (root-parallel: every worker samples independently).
+    Returns the worker's local top-K unique candidates as [(cost, tree, hash), ...].
+    """
+    rng = np.random.default_rng(seed)
+    num_panels = len(panels)
+
+    # All randomness of the chunk in one draw: 3 uniforms per split node, n-1 split nodes per tree
+    draws = rng.random((iterations, max(num_panels - 1, 0), 3))
+    targets = layout._targets_for(num_panels)
+
+    # Early exit against the running best (compiled kernel) is only safe when a single winner is wanted:
+    # for top-K, a pruned sample could be needed once duplicate structures are dropped
+    prune = k == 1
+
+    # Score every sample without building trees; trees are only rebuilt for the winners below
+    if targets is None:
+        costs = [0] * iterations
+    else:
+        ranks, target_pct = targets
+        args = (
+            draws, np.array(_importance_prefix(panels), dtype=np.float64),
+            np.array(layout._prob_h_by_depth, dtype=np.float64), layout._prob_h_fallback,
+            np.array(ranks, dtype=np.int64), target_pct,
+            float(layout.w), float(layout.h), layout.direction == 'rtl'
+        )
+        if _score_draws_jit is not None:
+            costs = _score_draws_jit(*args, prune).tolist()
+        else:
+            costs = _score_draws_batched(*args).tolist()
+
+    results = []
+    seen_hashes = set()
+    for i in sorted(range(iterations), key=costs.__getitem__):
+        if len(results) >= k: break
+        cost = costs[i]
+        tree = layout._random_tree(panels, draws[i].tolist())
+        t_hash = layout._hash_tree(tree, panels)
+        if t_hash in seen_hashes:
+            continue
+        seen_hashes.add(t_hash)
+        # Only the winners are converted to the nested dict form used by the optimizer
+        results.append((cost, layout._to_node_tree(tree, panels), t_hash))
+    return results
+
 
 class CaoInitialLayout:
     """
@@ -11,17 +273,41 @@ class CaoInitialLayout:
     recursively (Binary Space Partitioning). It decides "Panel A is above Panel B" or "Panel C is to the left of Panel D".
     """
     
-    def __init__(self, style_model_path, page_width=1000, page_height=1414, direction='rtl'):
+    def __init__(self, style_model_path, page_width=1000, page_height=1414, direction='rtl', workers=None, seed=None):
         self.w = page_width
         self.h = page_height
         self.direction = direction.lower() # Page reading order, 'rtl' is right to left
+        self.workers = workers # Processes used by the Monte Carlo search (None = in-process)
+        self.seed = seed # Base seed, worker i uses seed + i (None = non-deterministic)
         
         # Load the learned probabilities from the style model file
         if not os.path.exists(style_model_path):
             raise FileNotFoundError(f"Style model not found at: {style_model_path}")
             
-        with open(style_model_path, 'r') as f:
-            self.models = json.load(f)
+        self.models = load_style_model(style_model_path)
+
+        # Pre-tabulate the per-depth split probability and the per-rank importance targets
+        structure = self.models["structure"]
+        max_depth = max((int(k.split("_")[1]) for k in structure), default=0)
+        self._prob_h_by_depth = [structure.get(f"depth_{d}", structure["depth_0"])["H"] for d in range(max_depth + 1)]
+        self._prob_h_fallback = structure["depth_0"]["H"]
+        self._importance_keys = [int(k) for k in self.models["importance"]]
+        self._targets_by_n = {} # num_panels -> (ranks, target_pct); filled lazily, see _targets_for
+
+    def _targets_for(self, num_panels):
+        """
+        Returns (ranks, target_pct) for a page of num_panels, resolving the closest model key once.
+        ranks lists the area ranks that have a target in the importance model.
+        """
+        if num_panels not in self._targets_by_n:
+            if not self._importance_keys:
+                self._targets_by_n[num_panels] = None
+            else:
+                closest = min(self._importance_keys, key=lambda k: abs(k - num_panels))
+                targets = self.models["importance"][str(closest)]
+                ranks = [rank for rank in range(num_panels) if str(rank) in targets]
+                self._targets_by_n[num_panels] = (ranks, np.array([targets[str(rank)] for rank in ranks], dtype=np.float64))
+        return self._targets_by_n[num_panels]
 
     def generate_layout(self, panels, return_tree=False):
         """
@@ -39,25 +325,8 @@ class CaoInitialLayout:
         """
         if not panels: return []
         
-        num_panels = len(panels)
-        best_tree = None
-        best_cost = float('inf')
-        
         # Monte Carlo Search, Try to generate 1000 random layout, and keep the best one
-        iterations = 1000
-        
-        for _ in range(iterations):
-            # 1. Generate a random tree based on Structure Probability
-            root_rect = {'x': 0, 'y': 0, 'w': self.w, 'h': self.h}
-            tree = self._random_tree(panels, root_rect, depth=0)
-            
-            # 2. Score it based on Importance & Shape models
-            cost = self._score_tree(tree, num_panels)
-            
-            # 3. Keep the winner
-            if cost < best_cost:
-                best_cost = cost
-                best_tree = tree
+        best_tree = self._search(panels, k=1)[0][1]
         if return_tree:
             return best_tree
         
@@ -71,34 +340,8 @@ class CaoInitialLayout:
         """
         if not panels: return []
         
-        num_panels = len(panels)
-        candidates = []
-        
-        # 1. Run Monte Carlo
-        iterations = 1000
-        for _ in range(iterations):
-            root_rect = {'x': 0, 'y': 0, 'w': self.w, 'h': self.h}
-            tree = self._random_tree(panels, root_rect, depth=0)
-            cost = self._score_tree(tree, num_panels)
-            
-            tree_hash = self._hash_tree(tree)
-            candidates.append((cost, tree, tree_hash))
-            
-        # 2. Sort by Cost (Lowest is best)
-        candidates.sort(key=lambda x: x[0])
-        
-        # 3. Collect top K unique layouts
         results = []
-        seen_hashes = set()
-        
-        for cost, tree, t_hash in candidates:
-            if len(results) >= k: break
-            
-            if t_hash in seen_hashes:
-                continue 
-            
-            seen_hashes.add(t_hash)
-            
+        for cost, tree, _ in self._search(panels, k):
             # CHECK: Return Tree or Flat Panel?
             if return_trees:
                 results.append((cost, tree))
@@ -108,152 +351,172 @@ class CaoInitialLayout:
             
         return results
 
-    def _hash_tree(self, node):
-        """Helper to create a unique signature for a tree structure."""
-        if node["type"] == "leaf":
-            return f"L({node['p_idx']})"
+    def _search(self, panels, k):
+        """
+        Splits the Monte Carlo iterations across worker processes, then merges the
+        local top-K lists of every worker into the global top-K unique candidates.
+        """
+        # Both scorers finish the whole search in a few ms, so by default a process pool would only add overhead
+        workers = max(1, min(self.workers or 1, MC_ITERATIONS))
+        chunks = [MC_ITERATIONS // workers + (1 if wid < MC_ITERATIONS % workers else 0) for wid in range(workers)]
+        seeds = [None if self.seed is None else self.seed + wid for wid in range(workers)]
+
+        if workers == 1:
+            worker_results = [_search_worker(self, panels, chunks[0], seeds[0], k)]
         else:
-            # Hash format: "SplitType[LeftHash|RightHash]"
-            # This captures the structure regardless of precise coordinates
-            return f"{node['split']}[{self._hash_tree(node['left'])}|{self._hash_tree(node['right'])}]"
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                worker_results = list(pool.map(_search_worker, repeat(self), repeat(panels), chunks, seeds, repeat(k)))
 
-    def _random_tree(self, panels, rect, depth):
+        # K-way merge (Lowest cost is best), dropping structures found by several workers
+        merged = sorted((c for res in worker_results for c in res), key=lambda x: x[0])
+        results = []
+        seen_hashes = set()
+        for candidate in merged:
+            if len(results) >= k: break
+            if candidate[2] in seen_hashes:
+                continue
+            seen_hashes.add(candidate[2])
+            results.append(candidate)
+        return results
+
+    def _hash_tree(self, tree, panels):
+        """
+        Helper to create a unique signature for a tree structure (regardless of precise coordinates).
+        Children always have larger ids than their parent, so one reverse pass hashes bottom-up.
+        """
+        split, left, right, p_idx = tree.split.tolist(), tree.left.tolist(), tree.right.tolist(), tree.p_idx.tolist()
+        hashes = [0] * len(split)
+        for i in range(len(split) - 1, -1, -1):
+            if split[i] == _LEAF_CODE:
+                hashes[i] = hash((_LEAF_CODE, panels[p_idx[i]]['panel_index']))
+            else:
+                hashes[i] = hash((split[i], hashes[left[i]], hashes[right[i]]))
+        return hashes[0]
+
+    def _random_tree(self, panels, draws=None):
         """
-        Recursively splits the canvas (Binary Space Partitioning).
+        Splits the canvas (Binary Space Partitioning), one node per step of an explicit stack.
         
         Decisions made at each step:
         1. Split Direction (Horizontal vs Vertical) based on learned style probabilities.
         2. Split Ratio (Where to cut) based on the 'importance_score' of panels in each group.
+
+        Groups are kept as [lo, hi) ranges of the panel list, and the nodes are written into
+        flat per-field lists (see _FlatTree) instead of nested dicts.
+        draws holds pre-sampled uniforms [direction, split index, wiggle] for each split node.
         """
-        if len(panels) == 1:
-            return {
-                "type": "leaf", 
-                "p_idx": panels[0]['panel_index'], 
-                "rect": rect
-            }
+        if draws is None:
+            draws = np.random.default_rng().random((max(len(panels) - 1, 0), 3)).tolist()
 
-        # --- DECISION 1: Split Direction ---
-        # Reference the style model file where to split at each boxes
-        key = f"depth_{depth}"
-        if key not in self.models["structure"]: key = "depth_0"
-        prob_h = self.models["structure"][key]["H"]
-        split_type = "H" if random.random() < prob_h else "V"
-        
-        # --- DECISION 2: Split Ratio ---
-        # Randomly divide the list of panel into two groups to be put into each boxes
-        split_idx = random.randint(1, len(panels)-1)
-        grp_a = panels[:split_idx] # Earlier panels (e.g. Panel 0)
-        grp_b = panels[split_idx:] # Later panels (e.g. Panel 1)
-        
-        # Calculate importance score weight of Group A vs Total
-        w_a = sum(p.get('importance_score', 5) for p in grp_a)
-        w_tot = sum(p.get('importance_score', 5) for p in panels)
-        target_ratio = w_a / w_tot if w_tot > 0 else 0.5
-        
-        # Organic Wiggle / Adding a bit randomness
-        ratio = max(0.2, min(0.8, target_ratio + random.uniform(-0.05, 0.05)))
-        
-        x, y, w, h = rect['x'], rect['y'], rect['w'], rect['h']
-        
-        if split_type == "H": # If the cut is horizontal
-            # Horizontal: Top (A) -> Bottom (B). Unchanged for RTL.
-            rect_a = {'x': x, 'y': y, 'w': w, 'h': h * ratio}
-            rect_b = {'x': x, 'y': y + h * ratio, 'w': w, 'h': h * (1 - ratio)}
-            
-            return {
-                "type": "node", "split": "H",
-                "left": self._random_tree(grp_a, rect_a, depth + 1),  # Top
-                "right": self._random_tree(grp_b, rect_b, depth + 1)  # Bottom
-            }
-        else:
-            # Vertical: Left vs Right.
-            w_a = w * ratio
-            w_b = w * (1 - ratio)
-            
-            if self.direction == 'rtl':
-                # In Manga, the earlier panel (Group A) is on the RIGHT.
-                # The later panel (Group B) is on the LEFT.
-                # The Tree structure usually treats "Left Child" as geometric left,
-                # so we map Group B to the "Left Child".
-                
-                rect_right = {'x': x + w_b, 'y': y, 'w': w_a, 'h': h} # A goes here
-                rect_left  = {'x': x,       'y': y, 'w': w_b, 'h': h} # B goes here
-                
-                return {
-                    "type": "node", "split": "V",
-                    "left": self._random_tree(grp_b, rect_left, depth + 1),   # Left Branch = Later Panels
-                    "right": self._random_tree(grp_a, rect_right, depth + 1)  # Right Branch = Earlier Panels
-                }
-            else:
-                # LTR: Group A goes Left.
-                rect_left  = {'x': x,       'y': y, 'w': w_a, 'h': h}
-                rect_right = {'x': x + w_a, 'y': y, 'w': w_b, 'h': h}
-                
-                return {
-                    "type": "node", "split": "V",
-                    "left": self._random_tree(grp_a, rect_left, depth + 1),   # Left Branch = Earlier Panels
-                    "right": self._random_tree(grp_b, rect_right, depth + 1)  # Right Branch = Later Panels
-                }
-            
+        num_nodes = 2 * len(panels) - 1
+        split = [_LEAF_CODE] * num_nodes
+        left = [-1] * num_nodes
+        right = [-1] * num_nodes
+        p_idx = [-1] * num_nodes
+        rect = [None] * num_nodes
 
-    def _score_tree(self, tree, num_panels):
-        """
-        Calculates the 'Badness' of a layout. Lower is better. 
-        "Badness" is calculated by comparing generated area percentages against its importance score
-        """
-        leaves = self._get_leaves(tree)
-        leaves.sort(key=lambda x: x['rect']['w'] * x['rect']['h'], reverse=True)
-        
-        cost = 0
-        total_area = self.w * self.h
-        
-        # Fetch importance statistics for this number of panels
-        imp_key = str(num_panels)
-        if imp_key not in self.models["importance"]:
-            available_keys = [int(k) for k in self.models["importance"].keys()]
-            if available_keys:
-                closest = min(available_keys, key=lambda k: abs(k - num_panels))
-                imp_key = str(closest)
+        prefix = _importance_prefix(panels)
+
+        next_id = 0
+        next_draw = 0
+        # (parent id, child list to link into, lo, hi, x, y, w, h, depth)
+        stack = [(-1, None, 0, len(panels), 0, 0, self.w, self.h, 0)]
+        while stack:
+            parent, link, lo, hi, x, y, w, h, depth = stack.pop()
+            nid = next_id
+            next_id += 1
+            if link is not None:
+                link[parent] = nid
+            rect[nid] = (x, y, w, h)
+
+            if hi - lo == 1:
+                p_idx[nid] = lo
+                continue
+
+            # --- DECISION 1: Split Direction ---
+            # Reference the style model file where to split at each boxes
+            prob_h = self._prob_h_by_depth[depth] if depth < len(self._prob_h_by_depth) else self._prob_h_fallback
+            u_dir, u_idx, u_wiggle = draws[next_draw]
+            next_draw += 1
+            split_type = "H" if u_dir < prob_h else "V"
+            split[nid] = _SPLIT_CODES[split_type]
+
+            # --- DECISION 2: Split Ratio ---
+            # Randomly divide the list of panel into two groups to be put into each boxes
+            mid = lo + 1 + int(u_idx * (hi - lo - 1))
+            # Group A = [lo, mid) Earlier panels (e.g. Panel 0), Group B = [mid, hi) Later panels
+
+            # Calculate importance score weight of Group A vs Total
+            w_a = prefix[mid] - prefix[lo]
+            w_tot = prefix[hi] - prefix[lo]
+            target_ratio = w_a / w_tot if w_tot > 0 else 0.5
+
+            # Organic Wiggle / Adding a bit randomness
+            ratio = max(0.2, min(0.8, target_ratio + (u_wiggle - 0.5) * 0.1))
+
+            # Children are pushed right first so the left subtree is numbered first (pre-order)
+            if split_type == "H": # If the cut is horizontal
+                # Horizontal: Top (A) -> Bottom (B). Unchanged for RTL.
+                stack.append((nid, right, mid, hi, x, y + h * ratio, w, h * (1 - ratio), depth + 1)) # Bottom
+                stack.append((nid, left, lo, mid, x, y, w, h * ratio, depth + 1))                    # Top
             else:
-                return 0
-        
-        targets = self.models["importance"][imp_key]
-
-        # 1. Importance Cost: Do bigger rank panels get bigger areas?
-        for rank, leaf in enumerate(leaves):
-            rank_key = str(rank)
-            if rank_key in targets:
-                target_pct = targets[rank_key]
-                actual_pct = (leaf['rect']['w'] * leaf['rect']['h']) / total_area
-                cost += (actual_pct - target_pct) ** 2 * 100
-        
-        # 2. Shape Scoring: Penalize extremely thin/tall panels
-        for leaf in leaves:
-            w, h = leaf['rect']['w'], leaf['rect']['h']
-            ratio = w / h if h > 0 else 1.0
-            
-            if ratio < 0.5 or ratio > 2.0:
-                cost += 50
-            if ratio < 0.15 or ratio > 6.0:
-                cost += 1000
+                # Vertical: Left vs Right.
+                w_a = w * ratio
+                w_b = w * (1 - ratio)
 
-        return cost
+                if self.direction == 'rtl':
+                    # In Manga, the earlier panel (Group A) is on the RIGHT.
+                    # The later panel (Group B) is on the LEFT.
+                    # The Tree structure usually treats "Left Child" as geometric left,
+                    # so we map Group B to the "Left Child".
+                    stack.append((nid, right, lo, mid, x + w_b, y, w_a, h, depth + 1)) # Right Branch = Earlier Panels
+                    stack.append((nid, left, mid, hi, x, y, w_b, h, depth + 1))        # Left Branch = Later Panels
+                else:
+                    # LTR: Group A goes Left.
+                    stack.append((nid, right, mid, hi, x + w_a, y, w_b, h, depth + 1)) # Right Branch = Later Panels
+                    stack.append((nid, left, lo, mid, x, y, w_a, h, depth + 1))        # Left Branch = Earlier Panels
+
+        return _FlatTree(split, left, right, p_idx, rect)
+
+    def _to_node_tree(self, tree, panels, nid=0):
+        """Converts a _FlatTree into the nested dict tree ({'type', 'split', 'left', 'right', 'rect'})."""
+        x, y, w, h = tree.rect[nid].tolist()
+        if tree.split[nid] == _LEAF_CODE:
+            return {
+                "type": "leaf",
+                "p_idx": panels[tree.p_idx[nid]]['panel_index'],
+                "rect": {'x': x, 'y': y, 'w': w, 'h': h}
+            }
+        return {
+            "type": "node", "split": "H" if tree.split[nid] == _SPLIT_CODES["H"] else "V",
+            "left": self._to_node_tree(tree, panels, int(tree.left[nid])),
+            "right": self._to_node_tree(tree, panels, int(tree.right[nid]))
+        }
 
     def _get_leaves(self, node):
-        if node["type"] == "leaf":
-            return [node]
-        return self._get_leaves(node["left"]) + self._get_leaves(node["right"])
+        """Collects the leaves left-to-right with an explicit stack (no per-level list concatenation)."""
+        leaves = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n["type"] == "leaf":
+                leaves.append(n)
+            else:
+                stack.append(n["right"])
+                stack.append(n["left"])
+        return leaves
 
     def _flatten_tree(self, node, original_panels):
         """
         Converts the tree structure back into the flat panel list.
         """
         leaves = self._get_leaves(node)
+        panels_by_idx = {p['panel_index']: p for p in original_panels}
         result = []
         
         for leaf in leaves:
             # Find the original panel metadata
-            orig = next(p for p in original_panels if p['panel_index'] == leaf['p_idx'])
+            orig = panels_by_idx[leaf['p_idx']]
             new_p = orig.copy()
             r = leaf['rect']
             
@@ -1,7 +1,20 @@
 import numpy as np
 from scipy.optimize import minimize
-import json
 import math
+from lib.page.style_model import load_style_model
+
+# Forward-difference step for the energy gradient (same scale as SciPy's default)
+FD_STEP = np.sqrt(np.finfo(float).eps)
+
+
+def _poly_area(poly):
+    """Shoelace area of a polygon given as a sequence of [x, y] (single pass, no temporaries)."""
+    total = 0.0
+    prev_x, prev_y = poly[-1]
+    for x, y in poly:
+        total += prev_x * y - prev_y * x
+        prev_x, prev_y = x, y
+    return 0.5 * abs(total)
 
 class LayoutOptimizer:
     """
@@ -14,52 +27,20 @@ class LayoutOptimizer:
     1. Panel Area (matching the Importance Score)
     2. Panel Shape (keeping panels reasonably rectangular, avoiding slivers or weird shapes)
     """
-    def __init__(self, style_model_path, page_width=1000, page_height=1414, gutter=20):
+    def __init__(self, style_model_path, page_width=1000, page_height=1414, gutter=20, max_angle_depth=None):
         self.w = page_width
         self.h = page_height
         self.gutter = gutter # Gap between panel
+        # Only cuts down to this tree depth (root = 0) get an optimized angle; deeper cuts stay straight.
+        # None optimizes every angle. Fewer variables = fewer energy evaluations per L-BFGS-B step.
+        self.max_angle_depth = max_angle_depth
         
 
         # Load style stats (e.g. average angles) - currently used to initialize or bound optimization
-        with open(style_model_path, 'r') as f:
-            data = json.load(f)
-            self.shape_model = data["shape"]
-            self.mean_deltas = np.array(self.shape_model["mean"])
-            self.std_deltas = np.array(self.shape_model["std"]) + 1e-5
-
-    def shrink_panel(polygon, gutter_px):
-        """
-        Shrinks a polygon by 'gutter_px' pixels from all sides (approximated via scaling).
-        """
-        # 1. Calculate Centroid
-        poly_arr = np.array(polygon)
-        xs = poly_arr[:, 0]
-        ys = poly_arr[:, 1]
-        centroid_x = np.mean(xs)
-        centroid_y = np.mean(ys)
-        
-        # 2. Calculate Width/Height to determine Scale Factor
-        w = np.max(xs) - np.min(xs)
-        h = np.max(ys) - np.min(ys)
-        
-        if w <= gutter_px * 2 or h <= gutter_px * 2:
-            return polygon # Too small to shrink safely
-        
-        # Scale factors (approximate uniform shrink)
-        scale_x = (w - gutter_px * 2) / w
-        scale_y = (h - gutter_px * 2) / h
-        
-        # Use the smaller scale to be safe (or uniform scale)
-        scale = min(scale_x, scale_y)
-        
-        new_poly = []
-        for x, y in polygon:
-            # Move point towards centroid
-            nx = centroid_x + (x - centroid_x) * scale
-            ny = centroid_y + (y - centroid_y) * scale
-            new_poly.append([nx, ny])
-            
-        return new_poly
+        data = load_style_model(style_model_path)
+        self.shape_model = data["shape"]
+        self.mean_deltas = np.array(self.shape_model["mean"])
+        self.std_deltas = np.array(self.shape_model["std"]) + 1e-5
 
     def optimize(self, layout_tree, panels_metadata):
         """
@@ -75,7 +56,9 @@ class LayoutOptimizer:
         """
         # 1. Identify all "Cut Nodes" in the tree
         # We need to optimize 2 variables for every cut: [Ratio, Angle]
+        # Topology never changes during optimization, so nodes and their parameter slots are mapped once
         nodes = self._collect_nodes(layout_tree)
+        node_index = {id(node): i for i, node in enumerate(nodes)}
         num_cuts = len(nodes)
         
         if num_cuts == 0:
@@ -101,19 +84,35 @@ class LayoutOptimizer:
             bounds.extend([(0.2, 0.8), (-0.15, 0.15)]) 
 
         x0 = np.array(x0)
+        upper = np.array([b[1] for b in bounds])
+        imp_by_idx = self._importance_lookup(panels_metadata)
+
+        # Active variables: every ratio, but only the angles allowed by max_angle_depth.
+        # Inactive angles keep their x0 value (0.0) and are left out of the search space.
+        active = np.ones(len(x0), dtype=bool)
+        if self.max_angle_depth is not None:
+            depths = self._node_depths(layout_tree)
+            for i, node in enumerate(nodes):
+                active[i*2+1] = depths[id(node)] <= self.max_angle_depth
+        active_idx = np.flatnonzero(active)
 
         # 3. Optimize the energy function using Scipy
+        # The gradient is supplied by _energy_and_grad (jac=True) instead of L-BFGS-B's
+        # numerical probes, each of which would rebuild the whole page
         res = minimize(
-            fun=self._energy_function,
-            x0=x0,
-            args=(layout_tree, nodes, panels_metadata),
+            fun=self._energy_and_grad,
+            x0=x0[active_idx],
+            args=(layout_tree, nodes, node_index, imp_by_idx, upper, x0, active_idx),
             method='L-BFGS-B',
-            bounds=bounds,
+            jac=True,
+            bounds=[bounds[j] for j in active_idx],
             options={'maxiter': 50}
         )
         
         # 4. Generate Final Shapes
-        raw_panels = self._tree_to_panels(layout_tree, res.x, panels_metadata)
+        params = x0.copy()
+        params[active_idx] = res.x
+        raw_panels = self._tree_to_panels(layout_tree, params, panels_metadata, node_index)
 
         # Apply the gutters
         return self._apply_gutters(raw_panels)
@@ -123,107 +122,158 @@ class LayoutOptimizer:
         if self.gutter <= 0:
             return panels
             
-        final_panels = []
-        for p in panels:
-            new_p = p.copy()
-            new_p['polygon'] = self._shrink_polygon(p['polygon'], self.gutter)
-            final_panels.append(new_p)
+        final_panels = [p.copy() for p in panels]
+
+        # Group panels by vertex count so every group shrinks as one (P, V, 2) array
+        groups = {}
+        for i, p in enumerate(panels):
+            groups.setdefault(len(p['polygon']), []).append(i)
+
+        for num_vertices, idxs in groups.items():
+            if num_vertices == 0:
+                continue
+            polys = np.array([panels[i]['polygon'] for i in idxs], dtype=np.float64)
+            shrunk = self._shrink_polygons(polys, self.gutter)
+            for i, poly in zip(idxs, shrunk.tolist()):
+                final_panels[i]['polygon'] = poly
         return final_panels
 
-    def _shrink_polygon(self, polygon, px):
-        """Shrinks a polygon towards its centroid to create gutters"""
-        poly_arr = np.array(polygon)
-        xs = poly_arr[:, 0]
-        ys = poly_arr[:, 1]
-        
+    def _shrink_polygons(self, polys, px):
+        """
+        Shrinks a batch of polygons (P, V, 2) towards their centroids to create gutters.
+        Polygons too small to shrink are returned unchanged.
+        """
         # Centroid
-        cx = np.mean(xs)
-        cy = np.mean(ys)
-        
+        centroids = polys.mean(axis=1, keepdims=True)
+
         # BBox size
-        w = np.max(xs) - np.min(xs)
-        h = np.max(ys) - np.min(ys)
-        
-        if w <= px * 2 or h <= px * 2:
-            return polygon # Too small to shrink
-            
+        w = polys[..., 0].max(axis=1) - polys[..., 0].min(axis=1)
+        h = polys[..., 1].max(axis=1) - polys[..., 1].min(axis=1)
+        valid = (w > px * 2) & (h > px * 2)
+
         # Calculate Scale Factor
         # We want to reduce width by (2 * px)
-        scale_x = (w - px * 2) / w
-        scale_y = (h - px * 2) / h
-        scale = min(scale_x, scale_y)
-        
-        new_poly = []
-        for x, y in polygon:
-            nx = cx + (x - cx) * scale
-            ny = cy + (y - cy) * scale
-            new_poly.append([nx, ny])
-            
-        return new_poly
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.minimum((w - px * 2) / w, (h - px * 2) / h)
 
-    def _energy_function(self, x, tree, nodes, meta):
-        """
-        The Cost Function ("Badness"). The optimizer tries to make this 0.
+        shrunk = centroids + (polys - centroids) * scale[:, None, None]
+        return np.where(valid[:, None, None], shrunk, polys)
+
+    def _importance_lookup(self, meta):
+        """panel_index -> importance_score (first match wins, like the old linear scan)."""
+        imp_by_idx = {}
+        for m in meta:
+            imp_by_idx.setdefault(m['panel_index'], m.get('importance_score', 5))
+        return imp_by_idx
+
+    def _panel_energy(self, polygon, panel_index, imp_by_idx):
+        """Energy contribution of a single panel polygon."""
+        # --- Check Shape Validity ---
+        if len(polygon) < 3: 
+            return 10000
         
-        It reconstructs the page with the current trial angles/ratios and checks:
-        1. Does the Area match the Importance Score? (Primary Factor)
-        2. Is the Shape weird? (Secondary Factor)
-        """
-        # 1. Reconstruct the page geometry with these angles
-        final_panels = self._tree_to_panels(tree, x, meta)
+        # --- Area Cost (Importance) ---
+        # Calculate Polygon Area using Shoelace Area
+        area = _poly_area(polygon)
         
-        total_cost = 0
+        # Get Target Area based on Importance Score
+        imp_score = imp_by_idx.get(panel_index, 5)
+        # Heuristic target: Importance * constant (Rough estimate of ideal pixel area)
+        target_area = imp_score * (self.w * self.h / 25) 
         
-        # 2. Calculate Costs
-        for p in final_panels:
-            # --- Check Shape Validity ---
-            poly = np.array(p['polygon'])
-            if len(poly) < 3: 
-                total_cost += 10000; continue
-            
-            # --- Area Cost (Importance) ---
-            # Calculate Polygon Area using Shoelace Area
-            xs, ys = poly[:, 0], poly[:, 1]
-            area = 0.5 * np.abs(np.dot(xs, np.roll(ys, 1)) - np.dot(ys, np.roll(xs, 1)))
-            
-            # Get Target Area based on Importance Score
-            imp_score = next((m['importance_score'] for m in meta if m['panel_index'] == p['panel_index']), 5)
-            # Heuristic target: Importance * constant (Rough estimate of ideal pixel area)
-            target_area = imp_score * (self.w * self.h / 25) 
-            
-            # Penalize deviation from target area
-            total_cost += ((area - target_area) / target_area)**2 * 10
+        # Penalize deviation from target area
+        return ((area - target_area) / target_area)**2 * 10
+
+    def _energy_and_grad(self, x, tree, nodes, node_index, imp_by_idx, upper, base, active_idx):
+        """
+        The Cost Function ("Badness") plus its forward-difference gradient, for L-BFGS-B with jac=True.
+        The energy is the sum of _panel_energy over the page sliced with these ratios/angles.
+        x holds only the active variables; they are scattered into a copy of 'base' (all params).
+
+        A cut's [ratio, angle] only moves the panels below it, so every probe re-slices
+        just that subtree, starting from the polygon cached for it in the base pass.
+        """
+        params = base.copy()
+        params[active_idx] = x
+        # Plain floats for the slicing geometry (indexing an ndarray boxes every value)
+        params = params.tolist()
+
+        page_poly = [[0,0], [self.w,0], [self.w,self.h], [0,self.h]]
+        node_polys = {}
+        node_costs = {}
+        energy = self._subtree_energy(tree, page_poly, params, node_index, imp_by_idx, node_polys, node_costs)
+
+        grad = np.zeros_like(x)
+        probe = list(params)
+        for g, j in enumerate(active_idx):
+            node = nodes[j // 2]
+            step = FD_STEP * max(1.0, abs(params[j]))
+            if params[j] + step > upper[j]:
+                step = -step # Stay inside the bounds
+            probe[j] = params[j] + step
+            cost = self._subtree_energy(node, node_polys[id(node)], probe, node_index, imp_by_idx)
+            probe[j] = params[j]
+            grad[g] = (cost - node_costs[id(node)]) / step
+
+        return energy, grad
 
-        return total_cost
+    def _subtree_energy(self, node, poly, params, node_index, imp_by_idx, node_polys=None, node_costs=None):
+        """Energy of the panels under 'node' when it is sliced from 'poly'. Optionally records each split's input polygon and subtree energy."""
+        if node["type"] == "leaf":
+            return self._panel_energy(poly, node["p_idx"], imp_by_idx)
+
+        poly_a, poly_b = self._cut(node, poly, params, node_index)
+        cost = self._subtree_energy(node["left"], poly_a, params, node_index, imp_by_idx, node_polys, node_costs)
+        cost += self._subtree_energy(node["right"], poly_b, params, node_index, imp_by_idx, node_polys, node_costs)
+
+        if node_polys is not None:
+            node_polys[id(node)] = poly
+            node_costs[id(node)] = cost
+        return cost
 
     def _collect_nodes(self, node):
-        """Recursively collects all 'node' type objects (splits) from the tree."""
-        if node["type"] == "leaf": return []
-        return [node] + self._collect_nodes(node["left"]) + self._collect_nodes(node["right"])
+        """Collects all 'node' type objects (splits) from the tree in pre-order, using an explicit stack."""
+        nodes = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n["type"] == "leaf":
+                continue
+            nodes.append(n)
+            stack.append(n["right"])
+            stack.append(n["left"])
+        return nodes
+
+    def _node_depths(self, tree):
+        """id(node) -> depth (root = 0) for every split node."""
+        depths = {}
+        stack = [(tree, 0)]
+        while stack:
+            n, depth = stack.pop()
+            if n["type"] == "leaf":
+                continue
+            depths[id(n)] = depth
+            stack.append((n["right"], depth + 1))
+            stack.append((n["left"], depth + 1))
+        return depths
 
-    def _tree_to_panels(self, tree, params, meta):
+    def _tree_to_panels(self, tree, params, meta, node_index=None):
         """
         Reconstructs the polygons by slicing the page recursively.
+        node_index maps id(node) -> position of its [ratio, angle] pair in params.
         """
         # Start with full page polygon
         page_poly = [[0,0], [self.w,0], [self.w,self.h], [0,self.h]]
         
         # We need to map the flat list of optimization parameters back to specific nodes
-        nodes_flat = self._collect_nodes(tree)
-        
-        # Map node object to (ratio, angle)
-        param_map = {}
-        for i, node in enumerate(nodes_flat):
-            if i*2 < len(params):
-                param_map[id(node)] = (params[i*2], params[i*2+1])
-            else:
-                param_map[id(node)] = (0.5, 0.0)
+        if node_index is None:
+            node_index = {id(node): i for i, node in enumerate(self._collect_nodes(tree))}
 
         results = []
-        self._slice_recursive(tree, page_poly, param_map, results)
+        self._slice_recursive(tree, page_poly, params, node_index, results)
         return results
 
-    def _slice_recursive(self, node, poly, param_map, results):
+    def _slice_recursive(self, node, poly, params, node_index, results):
         if node["type"] == "leaf":
             results.append({
                 "panel_index": node["p_idx"],
@@ -231,14 +281,27 @@ class LayoutOptimizer:
             })
             return
 
+        poly_a, poly_b = self._cut(node, poly, params, node_index)
+        
+        self._slice_recursive(node["left"], poly_a, params, node_index, results)
+        self._slice_recursive(node["right"], poly_b, params, node_index, results)
+
+    def _cut(self, node, poly, params, node_index):
+        """Splits 'poly' along the cut of a split node. Returns Left/Top (A) and Right/Bottom (B)."""
         # Get cut parameters
-        ratio, angle = param_map.get(id(node), (0.5, 0.0))
+        i = node_index.get(id(node))
+        if i is not None and i*2 < len(params):
+            ratio, angle = params[i*2], params[i*2+1]
+        else:
+            ratio, angle = 0.5, 0.0
         
         # Calculate Cut Line
         # 1. Find Bounding Box of current poly to determine split point
-        pts = np.array(poly)
-        min_x, min_y = np.min(pts, axis=0)
-        max_x, max_y = np.max(pts, axis=0)
+        # (polygons are short [x, y] lists; plain min/max avoids an array round-trip per cut)
+        xs = [p[0] for p in poly]
+        ys = [p[1] for p in poly]
+        min_x, max_x = min(xs), max(xs)
+        min_y, max_y = min(ys), max(ys)
         w, h = max_x - min_x, max_y - min_y
         
         center_x = min_x + w/2
@@ -266,10 +329,7 @@ class LayoutOptimizer:
 
         # 3. Clip Polygon against Line
         # Returns two new polygons: Left/Top (A) and Right/Bottom (B)
-        poly_a, poly_b = self._clip_polygon(poly, (nx, ny), P0)
-        
-        self._slice_recursive(node["left"], poly_a, param_map, results)
-        self._slice_recursive(node["right"], poly_b, param_map, results)
+        return self._clip_polygon(poly, (nx, ny), P0)
 
     def _clip_polygon(self, poly, normal, origin):
         """
@@ -283,35 +343,29 @@ class LayoutOptimizer:
         nx, ny = normal
         ox, oy = origin
         
-        subject = poly
         new_poly_positive = []
         new_poly_negative = []
         
-        for i in range(len(subject)):
-            curr_p = subject[i]
-            prev_p = subject[i-1]
-            
-            # Check which side of the line the points are on (using Dot Product)
+        # Each vertex's side of the line (Dot Product) is computed once and carried to the next edge
+        prev_p = poly[-1]
+        prev_dist = nx*(prev_p[0]-ox) + ny*(prev_p[1]-oy)
+        
+        for curr_p in poly:
             curr_dist = nx*(curr_p[0]-ox) + ny*(curr_p[1]-oy)
-            prev_dist = nx*(prev_p[0]-ox) + ny*(prev_p[1]-oy)
+            
+            if (curr_dist >= 0) != (prev_dist >= 0):
+                # Line crossed -> Add Intersection to both halves
+                t = prev_dist / (prev_dist - curr_dist)
+                ix = prev_p[0] + t * (curr_p[0] - prev_p[0])
+                iy = prev_p[1] + t * (curr_p[1] - prev_p[1])
+                new_poly_positive.append([ix, iy])
+                new_poly_negative.append([ix, iy])
             
             if curr_dist >= 0:
-                if prev_dist < 0:
-                    # Line crossed from negative to positive -> Add Intersection
-                    t = prev_dist / (prev_dist - curr_dist)
-                    ix = prev_p[0] + t * (curr_p[0] - prev_p[0])
-                    iy = prev_p[1] + t * (curr_p[1] - prev_p[1])
-                    new_poly_positive.append([ix, iy])
-                    new_poly_negative.append([ix, iy])
                 new_poly_positive.append(curr_p)
             else:
-                if prev_dist >= 0:
-                    # Line crossed from positive to negative -> Add Intersection
-                    t = prev_dist / (prev_dist - curr_dist)
-                    ix = prev_p[0] + t * (curr_p[0] - prev_p[0])
-                    iy = prev_p[1] + t * (curr_p[1] - prev_p[1])
-                    new_poly_positive.append([ix, iy])
-                    new_poly_negative.append([ix, iy])
                 new_poly_negative.append(curr_p)
+            
+            prev_p, prev_dist = curr_p, curr_dist
                 
-        return new_poly_negative, new_poly_positive # A and B
\ No newline at end of file
+        return new_poly_negative, new_poly_positive # A and B
@@ -0,0 +1,19 @@
+import functools
+import json
+import os
+
+
+@functools.lru_cache(maxsize=4)
+def _load_style_model(path, mtime):
+    # mtime is only part of the cache key so a retrained style model is re-read
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_style_model(style_model_path):
+    """
+    Returns the parsed style model (structure / importance / shape statistics).
+    The dict is parsed once per process and shared by every CaoInitialLayout / LayoutOptimizer,
+    so callers must treat it as read-only.
+    """
+    return _load_style_model(os.path.abspath(style_model_path), os.path.getmtime(style_model_path))
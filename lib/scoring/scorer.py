@@ -1,4 +1,5 @@
 import os
+import functools
 import torch
 from PIL import Image, ImageFont
 from transformers import CLIPProcessor, CLIPModel
@@ -14,7 +15,9 @@ def load_clip_model(model_id="openai/clip-vit-base-patch32"):
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"[Scoring] Loading CLIP model: {model_id} on {device}...")
     try:
-        model = CLIPModel.from_pretrained(model_id).to(device)
+        # fp16 weights on GPU halve the memory traffic of every forward pass; CPU stays fp32
+        dtype = torch.float16 if device == "cuda" else torch.float32
+        model = CLIPModel.from_pretrained(model_id, torch_dtype=dtype).to(device).eval()
         processor = CLIPProcessor.from_pretrained(model_id)
         return model, processor, device
     except Exception as e:
@@ -32,24 +35,50 @@ def get_verification_prompt(panel_data):
     style_suffix = ", rough pencil sketch, manga name, storyboard style, loose lines, messy drawing, monochrome"
     return scene_text + style_suffix
 
+def _clip_similarities(images, text_prompt, model, processor, device):
+    """Cosine similarity of each image to the prompt, as a list of floats."""
+    inputs = processor(text=[text_prompt], images=images, return_tensors="pt", padding=True, truncation=True, max_length=77).to(device)
+    inputs["pixel_values"] = inputs["pixel_values"].to(model.dtype)
+    with torch.inference_mode():
+        outputs = model(**inputs)
+    # Normalize in fp32 so half-precision weights don't shift the scores
+    image_embeds = outputs.image_embeds.float()
+    text_embeds = outputs.text_embeds.float()
+    image_embeds = image_embeds / image_embeds.norm(p=2, dim=-1, keepdim=True)
+    text_embeds = text_embeds / text_embeds.norm(p=2, dim=-1, keepdim=True)
+    return torch.matmul(image_embeds, text_embeds.t()).squeeze(-1).tolist()
+
 def calculate_clip_score(image_path, text_prompt, model, processor, device):
     if model is None or not os.path.exists(image_path): return 0.0
     try:
         image = Image.open(image_path).convert("RGB")
-        inputs = processor(text=[text_prompt], images=image, return_tensors="pt", padding=True, truncation=True, max_length=77).to(device)
-        with torch.no_grad():
-            outputs = model(**inputs)
-        image_embeds = outputs.image_embeds / outputs.image_embeds.norm(p=2, dim=-1, keepdim=True)
-        text_embeds = outputs.text_embeds / outputs.text_embeds.norm(p=2, dim=-1, keepdim=True)
-        return torch.matmul(text_embeds, image_embeds.t()).item()
+        return _clip_similarities([image], text_prompt, model, processor, device)[0]
     except Exception as e:
         print(f"[Scoring] Error calculating CLIP score: {e}")
         return 0.0
 
+def calculate_clip_scores_batch(image_paths, text_prompt, model, processor, device):
+    """Scores several images against one prompt in a single forward pass; missing images score 0.0."""
+    scores = [0.0] * len(image_paths)
+    if model is None: return scores
+    valid = [k for k, path in enumerate(image_paths) if path and os.path.exists(path)]
+    if not valid: return scores
+    try:
+        images = [Image.open(image_paths[k]).convert("RGB") for k in valid]
+        sims = _clip_similarities(images, text_prompt, model, processor, device)
+    except Exception as e:
+        # One unreadable image should not zero the whole batch
+        print(f"[Scoring] Batched CLIP scoring failed, scoring one by one: {e}")
+        sims = [calculate_clip_score(image_paths[k], text_prompt, model, processor, device) for k in valid]
+    for k, sim in zip(valid, sims):
+        scores[k] = sim
+    return scores
+
 # ==========================================
 # 2. GEOMETRIC PENALTY LOGIC
 # ==========================================
 
+@functools.lru_cache(maxsize=None)
 def _get_font_metrics():
     try:
         font = ImageFont.truetype(FONTPATH, 20)
@@ -136,12 +165,15 @@ def _calculate_intersection(box1, box2):
     if x_right < x_left or y_bottom < y_top: return 0.0
     return (x_right - x_left) * (y_bottom - y_top)
 
+def _keypoint_bbox(keypoints, width, height):
+    if keypoints is None or len(keypoints) == 0: return None
+    xs = keypoints[:, 0][keypoints[:, 0] > 0]
+    ys = keypoints[:, 1][keypoints[:, 1] > 0]
+    if len(xs) == 0 or len(ys) == 0: return None
+    return [float(xs.min())*width, float(ys.min())*height, float(xs.max())*width, float(ys.max())*height]
+
 def _get_face_bbox(person, width, height):
-    if not person.face_keypoints_2d: return None
-    xs = [kp[0] for kp in person.face_keypoints_2d if kp[0] > 0]
-    ys = [kp[1] for kp in person.face_keypoints_2d if kp[1] > 0]
-    if not xs or not ys: return None
-    return [min(xs)*width, min(ys)*height, max(xs)*width, max(ys)*height]
+    return _keypoint_bbox(person.face_keypoints_2d, width, height)
 
 def calculate_geometric_penalty(ref_layout, panel_data, people_result):
     """
@@ -176,14 +208,11 @@ def calculate_geometric_penalty(ref_layout, panel_data, people_result):
 
         for person in people_result.people:
             # Body Overlap (Weight: 1.0)
-            if person.pose_keypoints_2d:
-                pxs = [kp[0] for kp in person.pose_keypoints_2d if kp[0] > 0]
-                pys = [kp[1] for kp in person.pose_keypoints_2d if kp[1] > 0]
-                if pxs and pys:
-                    p_bbox = [min(pxs)*width, min(pys)*height, max(pxs)*width, max(pys)*height]
-                    intersect = _calculate_intersection(b_bbox, p_bbox)
-                    if intersect > 0:
-                        total_penalty += (intersect / b_area) * 100 * 1.0
+            p_bbox = _keypoint_bbox(person.pose_keypoints_2d, width, height)
+            if p_bbox:
+                intersect = _calculate_intersection(b_bbox, p_bbox)
+                if intersect > 0:
+                    total_penalty += (intersect / b_area) * 100 * 1.0
 
             # Face Overlap (Weight: 5.0)
             f_bbox = _get_face_bbox(person, width, height)
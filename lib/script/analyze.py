@@ -3,6 +3,9 @@ import json
 import time
 from lib.script.prompt import storyboard_prompt
 
+# Upper bound (seconds) for one storyboard request, so a stalled connection fails over to the next attempt
+STORYBOARD_TIMEOUT = 120.0
+
 def analyze_storyboard(client, panels, output_path, max_retry=3):
 
     metadata_path = os.path.join(output_path, "panel_metadata.json")
@@ -23,7 +26,8 @@ def analyze_storyboard(client, panels, output_path, max_retry=3):
             response = client.chat.completions.create(
                 model="gpt-4o",
                 messages=messages,
-                temperature=0.0
+                temperature=0.0,
+                timeout=STORYBOARD_TIMEOUT
             )
 
             result_text = response.choices[0].message.content
@@ -3,8 +3,21 @@ import os
 import json
 from tqdm import tqdm
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Tuple, Any
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
 def _analyze_metadata(manga_path: str, metadata: dict):
     image_path = os.path.join(manga_path, f"{metadata['id']}.png")
     width, height = metadata['frame_width'], metadata['frame_height']
@@ -14,17 +27,21 @@ def _analyze_metadata(manga_path: str, metadata: dict):
     speaker_and_text_length = {}
     speaker_and_text_bbox = {}
     related_text = set()
+    # Index text objects once instead of scanning them for every relation (first one wins on duplicate ids)
+    text_by_id = {text_object['id']: text_object for text_object in reversed(text_objects)}
     for relation in relations:
         related_body_id = relation['body_id']
         related_text_id = relation['text_id']
         related_text.add(related_text_id)
-        related_text_content = ""
-        for text_object in text_objects:
-            if text_object['id'] == related_text_id:
-                related_text_content = text_object['text']
-                break
+        text_object = text_by_id.get(related_text_id)
+        if text_object is not None:
+            related_text_content = text_object['text']
+        else:
+            # Unknown text id: no text, and the bbox falls back to the last text object as before
+            related_text_content = ""
+            text_object = text_objects[-1]
         speaker_and_text_length[related_body_id] = speaker_and_text_length.get(related_body_id, 0) + len(related_text_content)
-        speaker_and_text_bbox[related_body_id] = speaker_and_text_bbox.get(related_body_id, []) + ([{"bbox": text_object['bbox'], "length": len(related_text_content)}])
+        speaker_and_text_bbox.setdefault(related_body_id, []).append({"bbox": text_object['bbox'], "length": len(related_text_content)})
 
     speaker_objects = []
     non_speaker_objects = []
@@ -56,29 +73,34 @@ def _analyze_metadata(manga_path: str, metadata: dict):
 
 
 
+def _process_manga_dir(manga_path: str) -> List[Tuple[str, dict]]:
+    annotation_file = os.path.join(manga_path, 'annotation.json')
+    with open(annotation_file, 'rb') as f:
+        metadatum = _json_loads(f.read())
+
+    entries = []
+    for metadata in metadatum:
+        num_speakers, num_non_speakers, content = _analyze_metadata(manga_path, metadata)
+        entries.append((f"{num_speakers}_{num_non_speakers}", content))
+    return entries
+
+
 def main():
     DATASET_PATH = "./curated_dataset"
     
-    result = {}
-    for manga_dir in tqdm(os.listdir(DATASET_PATH), desc="Processing manga directories"):
-        manga_path = os.path.join(DATASET_PATH, manga_dir)
-        if not os.path.isdir(manga_path):
-            continue
-            
-        annotation_file = os.path.join(manga_path, 'annotation.json')
-        with open(annotation_file, 'r', encoding='utf-8') as f:
-            metadatum = json.load(f)
-        
-        for metadata in metadatum:
-            num_speakers, num_non_speakers, content = _analyze_metadata(manga_path, metadata)
-            key = f"{num_speakers}_{num_non_speakers}"
-            if key not in result:
-                result[key] = []
-            result[key].append(content)
+    manga_paths = [os.path.join(DATASET_PATH, d) for d in os.listdir(DATASET_PATH)]
+    manga_paths = [p for p in manga_paths if os.path.isdir(p)]
+
+    # Manga directories are independent, so parse them on all cores; map keeps the listing order
+    result = defaultdict(list)
+    with ProcessPoolExecutor() as executor:
+        for entries in tqdm(executor.map(_process_manga_dir, manga_paths, chunksize=4), total=len(manga_paths), desc="Processing manga directories"):
+            for key, content in entries:
+                result[key].append(content)
 
     output_path = os.path.join(DATASET_PATH, "database.json")
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=4, ensure_ascii=False)
+    with open(output_path, "wb") as f:
+        f.write(_json_dumps(result))
     
     print(f"Database saved to {output_path}")
     
@@ -3,6 +3,7 @@ from tqdm import tqdm
 from datetime import datetime
 import json
 import os
+import sys
 from dotenv import load_dotenv
 from PIL import Image
 
@@ -12,7 +13,7 @@ from lib.script.divide import divide_script, ele2panels, refine_elements
 from lib.image.image import generate_image, generate_image_prompts, enhance_prompts, generate_image_with_sd
 from lib.image.controlnet import detect_human, check_open, controlnet2bboxes, run_controlnet_openpose
 from lib.name.name import generate_name, generate_animepose_image
-from lib.scoring.scorer import load_clip_model, get_verification_prompt, calculate_clip_score, calculate_geometric_penalty
+from lib.scoring.scorer import load_clip_model, get_verification_prompt, calculate_clip_scores_batch, calculate_geometric_penalty
 
 from openai import OpenAI
 
@@ -32,7 +33,7 @@ from lib.image.resolution import get_optimal_resolution
 # -------------------------------
 def parse_args():
     parser = argparse.ArgumentParser(description="Pipeline script for processing")
-    parser.add_argument("--script_path", help="Path to the script file")
+    parser.add_argument("--script_path", help="Path to the script file, or '-' to read it from stdin")
     parser.add_argument("--output_path", help="Path for output")
     parser.add_argument("--resume_latest", action="store_true")
     parser.add_argument("--num_images", type=int, default=3)
@@ -44,6 +45,8 @@ def parse_args():
 # -------------------------------
 def main():
     args = parse_args()
+    # Read a piped script before anything else so the writer is never blocked
+    stdin_script = sys.stdin.read() if args.script_path == "-" else None
     NUM_REFERENCES = args.num_names
     resume_latest = args.resume_latest
 
@@ -66,6 +69,13 @@ def main():
     image_base_dir = os.path.join(base_dir, "images")
     os.makedirs(image_base_dir, exist_ok=True)
 
+    script_path = args.script_path
+    if stdin_script is not None:
+        # Keep the piped script with the run so it can be resumed
+        script_path = os.path.join(base_dir, "script.txt")
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(stdin_script)
+
     # Page Config
     PAGE_WIDTH, PAGE_HEIGHT = 1039, 1476
     MARGIN, GUTTER = 80, 15
@@ -88,7 +98,7 @@ def main():
     # SCRIPT PROCESSING
     # ---------------------------
     print("Dividing script...")
-    elements = divide_script(client, args.script_path, base_dir)
+    elements = divide_script(client, script_path, base_dir)
 
     print("Refining elements...")
     elements = refine_elements(elements, base_dir)
@@ -221,14 +231,15 @@ def main():
         winner_info = None
 
         print(f"Scoring Panel {i}...")
-        for var in panel_entry.get("variations", []):
-            c_score = calculate_clip_score(
-                var.get("image_path"),
-                ver_prompt,
-                clip_model,
-                clip_processor,
-                device
-            )
+        variations = panel_entry.get("variations", [])
+        clip_scores = calculate_clip_scores_batch(
+            [var.get("image_path") for var in variations],
+            ver_prompt,
+            clip_model,
+            clip_processor,
+            device
+        )
+        for var, c_score in zip(variations, clip_scores):
             var["clip_score"] = c_score
 
             for layout_opt in var.get("layout_options", []):
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from lib.page.layout_generator import (
+    CaoInitialLayout, _LEAF_CODE, _importance_prefix,
+    _score_draws, _score_draws_jit, _score_draws_batched,
+)
+
+STYLE_MODEL = "./style_model/style_models_manga109.json"
+PAGE_WIDTH, PAGE_HEIGHT = 879, 1316 # live area used by src/pipeline.py
+ITERATIONS = 300
+
+
+def _reference_cost(layout, tree, num_panels):
+    """Layout cost computed directly on a tree built by _random_tree (what the kernels must reproduce)."""
+    ranks, target_pct = layout._targets_for(num_panels)
+    sizes = tree.rect[tree.split == _LEAF_CODE, 2:]
+    cost = 0.0
+    for w, h in sizes.tolist():
+        ratio = w / h if h > 0 else 1.0
+        if ratio < 0.5 or ratio > 2.0:
+            cost += 50
+        if ratio < 0.15 or ratio > 6.0:
+            cost += 1000
+    actual_pct = sorted((w * h / (layout.w * layout.h) for w, h in sizes.tolist()), reverse=True)
+    for rank, target in zip(ranks, target_pct.tolist()):
+        cost += (actual_pct[rank] - target) ** 2 * 100
+    return cost
+
+
+def _setup(direction, num_panels):
+    layout = CaoInitialLayout(STYLE_MODEL, page_width=PAGE_WIDTH, page_height=PAGE_HEIGHT, direction=direction)
+    rng = np.random.default_rng(1000 * num_panels + (direction == "rtl"))
+    panels = [{"panel_index": i, "importance_score": int(rng.integers(1, 10))} for i in range(num_panels)]
+    draws = rng.random((ITERATIONS, num_panels - 1, 3))
+
+    reference = np.array([_reference_cost(layout, layout._random_tree(panels, d.tolist()), num_panels) for d in draws])
+
+    # Same arguments as _search_worker passes
+    ranks, target_pct = layout._targets_for(num_panels)
+    args = (
+        draws, np.array(_importance_prefix(panels), dtype=np.float64),
+        np.array(layout._prob_h_by_depth, dtype=np.float64), layout._prob_h_fallback,
+        np.array(ranks, dtype=np.int64), target_pct,
+        float(layout.w), float(layout.h), layout.direction == "rtl"
+    )
+    return reference, args
+
+
+def _kernels():
+    # The plain Python kernel is what numba compiles, so it is checked too
+    return [_score_draws] + ([_score_draws_jit] if _score_draws_jit is not None else [])
+
+
+@pytest.mark.parametrize("direction", ["rtl", "ltr"])
+@pytest.mark.parametrize("num_panels", range(1, 11))
+def test_score_kernels_match_reference(direction, num_panels):
+    reference, args = _setup(direction, num_panels)
+
+    for kernel in _kernels():
+        np.testing.assert_allclose(kernel(*args, False), reference, rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(_score_draws_batched(*args), reference, rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize("direction", ["rtl", "ltr"])
+@pytest.mark.parametrize("num_panels", range(1, 11))
+def test_score_kernels_pruning(direction, num_panels):
+    reference, args = _setup(direction, num_panels)
+    best_before = np.concatenate([[np.inf], np.minimum.accumulate(reference)[:-1]])
+    best = np.argmin(reference)
+
+    for kernel in _kernels():
+        pruned = kernel(*args, True)
+        # A sample is either scored exactly, or abandoned with a partial cost that is a lower bound
+        # of its full cost and no better than the best sample before it
+        exact = np.isclose(pruned, reference, rtol=1e-12, atol=1e-9)
+        abandoned = (pruned <= reference + 1e-9) & (pruned >= best_before - 1e-9)
+        assert np.all(exact | abandoned)
+        # The winner is never pruned
+        assert pruned[best] == pytest.approx(reference[best], rel=1e-12, abs=1e-9)
+        assert np.argmin(pruned) == best
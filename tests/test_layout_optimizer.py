@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from scipy.optimize import approx_fprime
+
+from lib.page.layout_generator import CaoInitialLayout
+from lib.page import layout_optimizer
+from lib.page.layout_optimizer import LayoutOptimizer, FD_STEP
+
+STYLE_MODEL = "./style_model/style_models_manga109.json"
+PAGE_WIDTH, PAGE_HEIGHT = 879, 1316 # live area used by src/pipeline.py
+
+
+def _full_energy(optimizer, x, tree, node_index, imp_by_idx, base, active_idx):
+    """Energy of the whole page, re-sliced from scratch (independent of the subtree caching)."""
+    params = base.copy()
+    params[active_idx] = x
+    panels = optimizer._tree_to_panels(tree, params.tolist(), None, node_index)
+    return sum(optimizer._panel_energy(p["polygon"], p["panel_index"], imp_by_idx) for p in panels)
+
+
+def _problem(num_panels, max_angle_depth):
+    panels = [{"panel_index": i, "importance_score": 1 + (3 * i) % 9} for i in range(num_panels)]
+    tree = CaoInitialLayout(STYLE_MODEL, PAGE_WIDTH, PAGE_HEIGHT, seed=num_panels).generate_layout(panels, return_tree=True)
+    optimizer = LayoutOptimizer(STYLE_MODEL, PAGE_WIDTH, PAGE_HEIGHT, max_angle_depth=max_angle_depth)
+
+    # Same setup as LayoutOptimizer.optimize
+    nodes = optimizer._collect_nodes(tree)
+    node_index = {id(node): i for i, node in enumerate(nodes)}
+    base = np.tile([0.5, 0.0], len(nodes))
+    upper = np.tile([0.8, 0.15], len(nodes))
+    lower = np.tile([0.2, -0.15], len(nodes))
+    active = np.ones(len(base), dtype=bool)
+    if max_angle_depth is not None:
+        depths = optimizer._node_depths(tree)
+        for i, node in enumerate(nodes):
+            active[i*2+1] = depths[id(node)] <= max_angle_depth
+    active_idx = np.flatnonzero(active)
+    imp_by_idx = optimizer._importance_lookup(panels)
+    return optimizer, tree, nodes, node_index, imp_by_idx, base, upper, lower, active_idx
+
+
+# The large step makes forward and backward differences clearly distinct, so a wrong step sign shows up
+@pytest.mark.parametrize("fd_step", [FD_STEP, 1e-3])
+@pytest.mark.parametrize("max_angle_depth", [None, 1])
+@pytest.mark.parametrize("num_panels", [2, 4, 7, 10])
+@pytest.mark.parametrize("point", ["start", "interior", "upper_bound"])
+def test_energy_gradient_matches_full_page_differences(num_panels, max_angle_depth, point, fd_step, monkeypatch):
+    monkeypatch.setattr(layout_optimizer, "FD_STEP", fd_step)
+    optimizer, tree, nodes, node_index, imp_by_idx, base, upper, lower, active_idx = _problem(num_panels, max_angle_depth)
+    hi, lo = upper[active_idx], lower[active_idx]
+    rng = np.random.default_rng(num_panels)
+
+    x = base[active_idx]
+    if point == "interior":
+        x = rng.uniform(lo, hi)
+    elif point == "upper_bound":
+        # Every other variable sits on its upper bound, where the step has to flip to stay inside
+        x = rng.uniform(lo, hi)
+        x[::2] = hi[::2]
+
+    energy, grad = optimizer._energy_and_grad(x, tree, nodes, node_index, imp_by_idx, upper, base, active_idx)
+
+    def full_energy(v):
+        return _full_energy(optimizer, v, tree, node_index, imp_by_idx, base, active_idx)
+
+    assert energy == pytest.approx(full_energy(x), rel=1e-12)
+
+    # Same signed steps as _energy_and_grad: forward, or backward where a forward step leaves the bounds
+    steps = fd_step * np.maximum(1.0, np.abs(x))
+    steps = np.where(x + steps > hi, -steps, steps)
+    expected = approx_fprime(x, full_energy, steps)
+
+    scale = max(1.0, np.abs(expected).max())
+    np.testing.assert_allclose(grad, expected, rtol=1e-5, atol=1e-5 * scale)
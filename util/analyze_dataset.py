@@ -449,10 +449,23 @@ def create_sample_visualization(valid_panels: List[Dict], categories: List[str],
     plt.show()
     print(f"サンプル画像を保存しました: {save_path}")
 
+def _png_names(dir_path: str) -> set:
+    """ディレクトリ内のPNGファイル名の集合（存在しなければ空）"""
+    if not os.path.isdir(dir_path):
+        return set()
+    with os.scandir(dir_path) as it:
+        return {entry.name for entry in it if entry.is_file() and entry.name.endswith(".png")}
+
 def analyze_resolution_distribution(valid_panels: List[Dict], curated_dataset_path: str):
     """解像度ごとの分布を分析"""
     resolutions = []
     
+    # パネルごとにstatを発行せず、書籍ディレクトリとPNG一覧をディレクトリ単位で一度だけ取得する
+    with os.scandir(curated_dataset_path) as it:
+        book_dirs = {entry.name for entry in it
+                     if entry.is_dir() and os.path.exists(os.path.join(entry.path, "annotation.json"))}
+    png_names_by_book = {}
+    
     for panel in valid_panels:
         panel_id = panel["id"]
         
@@ -465,13 +478,10 @@ def analyze_resolution_distribution(valid_panels: List[Dict], curated_dataset_pa
         # まず、実際のディレクトリが存在するかチェック
         for i in range(1, min(4, len(parts))):
             candidate_name = '_'.join(parts[:i])
-            candidate_path = os.path.join(curated_dataset_path, candidate_name)
-            if os.path.exists(candidate_path) and os.path.isdir(candidate_path):
-                # annotation.jsonが存在するかもチェック
-                annotation_path = os.path.join(candidate_path, "annotation.json")
-                if os.path.exists(annotation_path):
-                    book_name = candidate_name
-                    break
+            # annotation.jsonを持つディレクトリのみ対象
+            if candidate_name in book_dirs:
+                book_name = candidate_name
+                break
         
         # 見つからない場合は、従来の方法で推定
         if book_name is None:
@@ -483,8 +493,10 @@ def analyze_resolution_distribution(valid_panels: List[Dict], curated_dataset_pa
                 book_name = parts[0]
         
         image_path = os.path.join(curated_dataset_path, book_name, f"{panel_id}.png")
+        if book_name not in png_names_by_book:
+            png_names_by_book[book_name] = _png_names(os.path.join(curated_dataset_path, book_name))
         
-        if os.path.exists(image_path):
+        if f"{panel_id}.png" in png_names_by_book[book_name]:
             try:
                 with Image.open(image_path) as img:
                     width, height = img.size
@@ -500,9 +512,9 @@ def create_resolution_scatter_plot(resolutions: List[Tuple[int, int]], save_path
         print("解像度データがありません")
         return
     
-    # データを分離
-    widths = [w for w, h in resolutions]
-    heights = [h for w, h in resolutions]
+    # データを分離（統計はNumPyでまとめて計算）
+    sizes = np.asarray(resolutions, dtype=np.int64)
+    widths, heights = sizes[:, 0], sizes[:, 1]
     
     # 散布図を作成
     plt.figure(figsize=(12, 8))
@@ -517,10 +529,9 @@ def create_resolution_scatter_plot(resolutions: List[Tuple[int, int]], save_path
     
     # 統計情報を表示
     total_panels = len(resolutions)
-    avg_width = sum(widths) / total_panels
-    avg_height = sum(heights) / total_panels
-    min_width, max_width = min(widths), max(widths)
-    min_height, max_height = min(heights), max(heights)
+    avg_width, avg_height = sizes.mean(axis=0)
+    min_width, min_height = sizes.min(axis=0)
+    max_width, max_height = sizes.max(axis=0)
     
     # 統計情報をテキストで表示
     stats_text = f'総パネル数: {total_panels}\n'
@@ -2,6 +2,7 @@
 import os
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 # local modules (your project)
@@ -12,11 +13,19 @@ from lib.name.name import generate_name, generate_animepose_image
 from lib.scoring.scorer import (
     load_clip_model,
     get_verification_prompt,
-    calculate_clip_score,
+    calculate_clip_scores_batch,
     calculate_geometric_penalty,
 )
 from lib.page.composer import compose_manga_pdf
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Variations generated at once per panel; bounded so the WebUI/ControlNet backend isn't flooded
+MAX_VARIATION_WORKERS = 4
+
 def safe_float(x, default=0.0):
     try:
         return float(x)
@@ -25,10 +34,93 @@ def safe_float(x, default=0.0):
 
 def write_json(path, obj):
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
+        return
     with open(path, "w", encoding="utf-8") as f:
         json.dump(obj, f, ensure_ascii=False, indent=4, default=str)
 
 
+def _generate_variation(j, prompt, panel, panel_dir, num_names):
+    """Generate one image variation of a panel and its name layouts; None if it failed."""
+    print(f"  - Generating variation {j} ...")
+
+    # Base image
+    image_path = os.path.join(panel_dir, f"{j:02d}.png")
+    try:
+        generate_image_with_sd(prompt, image_path)
+    except Exception as e:
+        print(f"    [ERROR] SD generation failed: {e}")
+        return None
+
+    # Anime pose
+    anime_image_path = os.path.join(panel_dir, f"{j:02d}_anime.png")
+    try:
+        generate_animepose_image(image_path, prompt, anime_image_path)
+    except Exception as e:
+        print(f"    [WARN] generate_animepose_image failed: {e}")
+        anime_image_path = None
+
+    # ControlNet OpenPose
+    try:
+        openpose_result = run_controlnet_openpose(image_path, anime_image_path)
+    except Exception as e:
+        print(f"    [ERROR] OpenPose failed: {e}")
+        return None
+
+    # Bounding boxes
+    try:
+        bboxes = controlnet2bboxes(openpose_result)
+    except Exception as e:
+        print(f"    [WARN] controlnet2bboxes failed: {e}")
+        cw, ch = getattr(openpose_result, "canvas_width", 512), getattr(openpose_result, "canvas_height", 512)
+        bboxes = [[cw//4, ch//4, 3*cw//4, 3*ch//4]]
+
+    layout = generate_layout(bboxes, panel, openpose_result.canvas_width, openpose_result.canvas_height)
+    if layout is None:
+        print("    [WARN] invalid layout found.")
+        return None
+
+    scored_layouts = similar_layouts(layout)
+    layout_options = []
+
+    for idxL, item in enumerate(scored_layouts[:num_names]):
+        try:
+            ref_layout = item[0]
+            sim_score = safe_float(item[1], 0.0)
+
+            geom_penalty = calculate_geometric_penalty(ref_layout, panel, openpose_result)
+
+            save_name_path = os.path.join(panel_dir, f"{j:02d}_name_{idxL}.png")
+
+            try:
+                generate_name(openpose_result, layout, item, panel, save_name_path)
+            except Exception as e:
+                print(f"      [WARN] generate_name failed: {e}")
+
+            # Ensure saved path is absolute when storing
+            abs_save_name_path = os.path.abspath(save_name_path)
+
+            layout_options.append({
+                "rank": idxL,
+                "template_path": getattr(ref_layout, "image_path", None),
+                "generated_image_path": abs_save_name_path,
+                "sim_score": sim_score,
+                "geom_penalty": float(geom_penalty) if isinstance(geom_penalty, (int, float)) else 0.0,
+            })
+        except Exception as e:
+            print(f"      [WARN] layout scoring failed: {e}")
+            continue
+
+    return {
+        "variation_id": j,
+        "image_path": os.path.abspath(image_path),
+        "anime_image_path": os.path.abspath(anime_image_path) if anime_image_path else None,
+        "layout_options": layout_options
+    }
+
+
 # ---------------------------------------------------------
 # PIPELINE
 # ---------------------------------------------------------
@@ -69,9 +161,9 @@ def run_offline_pipeline(
     # 2. Check ControlNet (Optional)
     # ---------------------------------------------------------
     if controlnet_check:
-        ok = check_open()
-        if not ok:
-            print("[WARN] ControlNet/SD endpoint not reachable!")
+        # Fail fast: every panel would otherwise wait out its own SD timeouts
+        if not check_open():
+            raise RuntimeError("ControlNet/SD endpoint not reachable")
 
     # ---------------------------------------------------------
     # 3. Load CLIP once
@@ -103,84 +195,12 @@ def run_offline_pipeline(
 
         print(f"\n[Panel {i}] prompt_length={len(prompt)} elements={len(panel)}")
 
-        for j in range(num_images):
-            print(f"  - Generating variation {j} ...")
-
-            # Base image
-            image_path = os.path.join(panel_dir, f"{j:02d}.png")
-            try:
-                generate_image_with_sd(prompt, image_path)
-            except Exception as e:
-                print(f"    [ERROR] SD generation failed: {e}")
-                continue
-
-            # Anime pose
-            anime_image_path = os.path.join(panel_dir, f"{j:02d}_anime.png")
-            try:
-                generate_animepose_image(image_path, prompt, anime_image_path)
-            except Exception as e:
-                print(f"    [WARN] generate_animepose_image failed: {e}")
-                anime_image_path = None
-
-            # ControlNet OpenPose
-            try:
-                openpose_result = run_controlnet_openpose(image_path, anime_image_path)
-            except Exception as e:
-                print(f"    [ERROR] OpenPose failed: {e}")
-                continue
-
-            # Bounding boxes
-            try:
-                bboxes = controlnet2bboxes(openpose_result)
-            except Exception as e:
-                print(f"    [WARN] controlnet2bboxes failed: {e}")
-                cw, ch = getattr(openpose_result, "canvas_width", 512), getattr(openpose_result, "canvas_height", 512)
-                bboxes = [[cw//4, ch//4, 3*cw//4, 3*ch//4]]
-
-            layout = generate_layout(bboxes, panel, openpose_result.canvas_width, openpose_result.canvas_height)
-            if layout is None:
-                print("    [WARN] invalid layout found.")
-                continue
-
-            scored_layouts = similar_layouts(layout)
-            layout_options = []
-
-            for idxL, item in enumerate(scored_layouts[:num_names]):
-                try:
-                    ref_layout = item[0]
-                    sim_score = safe_float(item[1], 0.0)
-
-                    geom_penalty = calculate_geometric_penalty(ref_layout, panel, openpose_result)
-
-                    save_name_path = os.path.join(panel_dir, f"{j:02d}_name_{idxL}.png")
-
-                    try:
-                        generate_name(openpose_result, layout, item, panel, save_name_path)
-                    except Exception as e:
-                        print(f"      [WARN] generate_name failed: {e}")
-
-                    # Ensure saved path is absolute when storing
-                    abs_save_name_path = os.path.abspath(save_name_path)
-
-                    layout_options.append({
-                        "rank": idxL,
-                        "template_path": getattr(ref_layout, "image_path", None),
-                        "generated_image_path": abs_save_name_path,
-                        "sim_score": sim_score,
-                        "geom_penalty": safe_float(geom_penalty, 0.0),
-                    })
-                except Exception as e:
-                    print(f"      [WARN] layout scoring failed: {e}")
+        # Each variation only waits on the SD/ControlNet server, so keep several in flight
+        with ThreadPoolExecutor(max_workers=max(1, min(num_images, MAX_VARIATION_WORKERS))) as executor:
+            for variation in executor.map(lambda j: _generate_variation(j, prompt, panel, panel_dir, num_names), range(num_images)):
+                if variation is None:
                     continue
-
-            panel_entry["variations"].append({
-                "variation_id": j,
-                "image_path": os.path.abspath(image_path),
-                "anime_image_path": os.path.abspath(anime_image_path) if anime_image_path else None,
-                "layout_options": layout_options
-            })
-
-            write_json(os.path.join(panel_dir, "scores.json"), panel_entry)
+                panel_entry["variations"].append(variation)
 
         # ----------------------------
         # CLIP Scoring
@@ -194,23 +214,16 @@ def run_offline_pipeline(
         best_score = -1e9
         winner = {"variation": None, "layout_idx": None, "score": None}
 
-        for var in panel_entry["variations"]:
-            img_path = var["image_path"]
-            if not os.path.exists(img_path):
-                continue
+        # One CLIP forward pass over every variation image of the panel
+        scored_vars = [var for var in panel_entry["variations"] if os.path.exists(var["image_path"])]
+        clip_scores = calculate_clip_scores_batch([var["image_path"] for var in scored_vars], ver_prompt, clip_model, clip_processor, device)
 
-            try:
-                c_score = calculate_clip_score(img_path, ver_prompt, clip_model, clip_processor, device)
-            except Exception:
-                c_score = 0.0
-
-            var["clip_score"] = safe_float(c_score, 0.0)
+        # Scores were stored as floats above, so they are used as is
+        for var, c_score in zip(scored_vars, clip_scores):
+            var["clip_score"] = c_score
 
             for lo in var["layout_options"]:
-                sim = safe_float(lo["sim_score"])
-                geom = safe_float(lo["geom_penalty"])
-
-                final_score = (sim * 100.0) + (var["clip_score"] * 50.0) - geom
+                final_score = (lo["sim_score"] * 100.0) + (c_score * 50.0) - lo["geom_penalty"]
                 lo["final_score"] = final_score
 
                 if final_score > best_score:
@@ -226,6 +239,7 @@ def run_offline_pipeline(
                         "template_path": lo.get("template_path")
                     }
 
+        # Written once the panel is complete, not after every variation
         panel_entry["winner"] = winner
         write_json(os.path.join(panel_dir, "scores.json"), panel_entry)
 
@@ -25,9 +25,9 @@ def serialize_runtime_object(obj):
         }
     if "People" in str(type(obj)):
         return {
-            "pose_keypoints_2d_count": len(obj.pose_keypoints_2d) if obj.pose_keypoints_2d else 0,
-            "pose_keypoints_sample": obj.pose_keypoints_2d[:5] if obj.pose_keypoints_2d else [],
-            "face_keypoints_count": len(obj.face_keypoints_2d) if obj.face_keypoints_2d else 0
+            "pose_keypoints_2d_count": len(obj.pose_keypoints_2d),
+            "pose_keypoints_sample": obj.pose_keypoints_2d[:5].tolist(),
+            "face_keypoints_count": len(obj.face_keypoints_2d)
         }
     if isinstance(obj, MangaLayout):
         return {
@@ -126,7 +126,7 @@ def calculate_clip_score(image_path, text_prompt, model, processor, device):
 
 def get_face_bbox(person, width, height):
     """Calculates the bounding box of the face from normalized keypoints."""
-    if not person.face_keypoints_2d:
+    if len(person.face_keypoints_2d) == 0:
         return None
     
     # Keypoints are normalized (0.0-1.0), so multiply by canvas size
@@ -226,7 +226,7 @@ def get_pose_text(controlnet_result):
     text_data = []
     for i, person in enumerate(controlnet_result.people):
         text_data.append(f"Person {i+1}:")
-        if person.pose_keypoints_2d:
+        if len(person.pose_keypoints_2d) > 0:
             text_data.append(f"  Keypoints: {len(person.pose_keypoints_2d)} detected")
             text_data.append(f"  Sample (Nose): {person.pose_keypoints_2d[0] if len(person.pose_keypoints_2d) > 0 else 'N/A'}")
     return "\n".join(text_data)
@@ -499,7 +499,7 @@ else:
                 # OR better: assume bboxes match people index 1-to-1 (They usually do in the list order)
                 
                 # Let's do a quick body bbox calculation from pose keypoints
-                if person.pose_keypoints_2d:
+                if len(person.pose_keypoints_2d) > 0:
                     pxs = [kp[0] for kp in person.pose_keypoints_2d if kp[0] > 0]
                     pys = [kp[1] for kp in person.pose_keypoints_2d if kp[1] > 0]
                     p_bbox = [min(pxs)*width, min(pys)*height, max(pxs)*width, max(pys)*height]